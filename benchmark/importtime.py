@@ -0,0 +1,88 @@
+"""Measures the import time of every subpackage with `python -X importtime`.
+
+Each subpackage is imported in a fresh interpreter. The script fails if importing
+a subpackage pulls in one of the heavy dependencies, or takes longer than the
+given budget.
+"""
+import argparse
+import subprocess
+import sys
+
+SUBPACKAGES = [
+    "language_detection",
+    "named_entity_recognition",
+    "object_detection",
+    "sentiment_analysis",
+    "serving",
+    "speaker_diarization",
+    "speech_recognition",
+    "text_analysis",
+]
+
+HEAVY_MODULES = [
+    "librosa",
+    "pandas",
+    "pyannote.audio",
+    "spacy",
+    "torch",
+    "torchaudio",
+    "transformers",
+    "whisper",
+]
+
+
+def measure(module: str) -> tuple[int, list[str]]:
+    """Imports a module in a fresh interpreter.
+
+    Returns:
+        tuple[int, list[str]]: The cumulative import time in microseconds and
+        the names of all modules imported along the way.
+    """
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    cumulative = 0
+    imported = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        if not cumulative_us.strip().isdigit():
+            continue  # Header line
+        name = name.strip()
+        imported.append(name)
+        if name == module:
+            cumulative = int(cumulative_us)
+    return cumulative, imported
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="importtime",
+        description="Import time check",
+        epilog="Measures the import time of each subpackage.",
+    )
+    parser.add_argument(
+        "--max-ms",
+        type=float,
+        default=200.0,
+        help="Maximum allowed import time per subpackage in milliseconds.",
+    )
+    args = parser.parse_args()
+
+    failed = False
+    for subpackage in SUBPACKAGES:
+        module = f"dartmouth_ai_backend.{subpackage}"
+        cumulative, imported = measure(module)
+        heavy = [m for m in HEAVY_MODULES if m in imported]
+        ok = not heavy and cumulative / 1000 <= args.max_ms
+        failed |= not ok
+        print(
+            f"{'OK  ' if ok else 'FAIL'} {module:<50} {cumulative / 1000:8.1f} ms"
+            + (f"  (imports {', '.join(heavy)})" if heavy else "")
+        )
+
+    sys.exit(1 if failed else 0)
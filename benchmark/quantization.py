@@ -0,0 +1,111 @@
+"""Compares int8 quantized models with their float32 counterparts.
+
+For object detection and speech recognition, the script measures the average latency
+of both variants on the same input and reports how much the quantized output drifts
+from the float32 output.
+"""
+import argparse
+from pathlib import Path
+from timeit import default_timer as timer
+
+from dartmouth_ai_backend.object_detection import ObjectDetector
+from dartmouth_ai_backend.speech_recognition import SpeechRecognizer
+
+TEST_ROOT = Path(__file__).parent.parent.resolve() / "test"
+
+
+def latency(fn, reps: int) -> float:
+    """Returns the average time of `reps` calls of `fn` in seconds, after one warm-up call."""
+    fn()
+    start = timer()
+    for _ in range(reps):
+        fn()
+    return (timer() - start) / reps
+
+
+def box_drift(reference: dict, result: dict) -> tuple[float, float]:
+    """Returns the label agreement and the largest corner offset of shared labels in pixels."""
+    labels = set(reference) | set(result)
+    shared = set(reference) & set(result)
+    agreement = len(shared) / len(labels) if labels else 1.0
+    offset = max(
+        (
+            abs(a - b)
+            for label in shared
+            for a, b in zip(reference[label]["bbox"], result[label]["bbox"])
+        ),
+        default=0.0,
+    )
+    return agreement, offset
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Returns the word-level edit distance between two transcripts relative to the reference length."""
+    reference, hypothesis = reference.lower().split(), hypothesis.lower().split()
+    distances = list(range(len(hypothesis) + 1))
+    for i, ref_word in enumerate(reference, start=1):
+        previous, distances[0] = distances[0], i
+        for j, hyp_word in enumerate(hypothesis, start=1):
+            previous, distances[j] = distances[j], min(
+                distances[j] + 1,
+                distances[j - 1] + 1,
+                previous + (ref_word != hyp_word),
+            )
+    return distances[-1] / max(len(reference), 1)
+
+
+def benchmark_object_detection(image, reps: int, model_cache=None):
+    results = dict()
+    for quantize in [None, "int8"]:
+        detector = ObjectDetector(model_cache=model_cache, quantize=quantize)
+        seconds = latency(lambda: detector.detect(image, render=False), reps)
+        results[quantize] = (seconds, detector.detect(image, render=False))
+
+    agreement, offset = box_drift(results[None][1], results["int8"][1])
+    print(
+        f"Object detection:  fp32 {results[None][0]:.3f} s  int8 {results['int8'][0]:.3f} s"
+        f"  label agreement {agreement:.0%}  max box offset {offset:.1f} px"
+    )
+
+
+def benchmark_speech_recognition(speech_file, model: str, reps: int, model_cache=None):
+    results = dict()
+    for quantize in [None, "int8"]:
+        recognizer = SpeechRecognizer(
+            model=model, model_cache=model_cache, quantize=quantize
+        )
+        seconds = latency(lambda: recognizer.transcribe(speech_file), reps)
+        results[quantize] = (seconds, recognizer.transcribe(speech_file)["text"])
+
+    wer = word_error_rate(results[None][1], results["int8"][1])
+    print(
+        f"Speech recognition: fp32 {results[None][0]:.3f} s  int8 {results['int8'][0]:.3f} s"
+        f"  word error rate vs. fp32 {wer:.1%}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        prog="quantization",
+        description="Quantization benchmark",
+        epilog="Compares latency and output drift of int8 and float32 models.",
+    )
+    parser.add_argument(
+        "--image",
+        default=str(Path(__file__).parent.resolve() / "benchmark_files/desk.jpg"),
+        help="Image for object detection.",
+    )
+    parser.add_argument(
+        "--speech",
+        default=str(TEST_ROOT / "speech_recognition_sample.flac"),
+        help="Recording for speech recognition.",
+    )
+    parser.add_argument("--whisper-model", default="tiny", help="Whisper model.")
+    parser.add_argument("--model-cache", default=".cache/", help="Model directory.")
+    parser.add_argument("--reps", type=int, default=5, help="Repetitions per model.")
+    args = parser.parse_args()
+
+    benchmark_object_detection(args.image, args.reps, model_cache=args.model_cache)
+    benchmark_speech_recognition(
+        args.speech, args.whisper_model, args.reps, model_cache=args.model_cache
+    )
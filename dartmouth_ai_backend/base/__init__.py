@@ -1,3 +1,15 @@
+from .cache import ResultCache
 from .citable import Citable
+from .pool import AnalyzerPool
+from .registry import ModelHandle, ModelRegistry, default_registry
+from .runtime import RuntimeConfig
 
-__all__ = ["Citable"]
+__all__ = [
+    "AnalyzerPool",
+    "Citable",
+    "ModelHandle",
+    "ModelRegistry",
+    "ResultCache",
+    "RuntimeConfig",
+    "default_registry",
+]
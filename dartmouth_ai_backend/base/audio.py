@@ -0,0 +1,102 @@
+"""Decoded audio shared between the speech analyzers"""
+from os import PathLike
+from typing import TYPE_CHECKING, BinaryIO, Iterator, Union
+
+from .audio_preprocessing import SAMPLE_RATE, to_mono_16k
+
+if TYPE_CHECKING:
+    import torch
+
+
+class Audio:
+    """A decoded audio recording.
+
+    Holds the waveform as decoded from the source, its sample rate, and a cached
+    16 kHz mono view, which is what Whisper and pyannote operate on. Passing the
+    same `Audio` to several analyzers decodes and resamples the recording only once.
+    """
+
+    def __init__(self, waveform: "torch.Tensor", sample_rate: int):
+        """Wraps an already decoded waveform
+
+        Args:
+            waveform (torch.Tensor): Waveform of shape (channel, time).
+            sample_rate (int): Sample rate of the waveform.
+        """
+        self.waveform = waveform
+        self.sample_rate = sample_rate
+        self.__mono_16k = None
+
+    @classmethod
+    def load(cls, source: Union["Audio", BinaryIO, str, PathLike]) -> "Audio":
+        """Decodes an audio file, unless it already has been decoded.
+
+        Args:
+            source (Audio, path-like object or file-like object): Audio to load.
+
+        Returns:
+            Audio: The decoded audio.
+        """
+        if isinstance(source, cls):
+            return source
+        import torchaudio
+
+        # torchaudio also supports loading MP3 from a BytesIO object
+        waveform, sample_rate = torchaudio.load(source)
+        return cls(waveform, sample_rate)
+
+    @property
+    def mono_16k(self) -> "torch.Tensor":
+        """The float32 waveform downmixed to mono and resampled to 16 kHz"""
+        if self.__mono_16k is None:
+            self.__mono_16k = to_mono_16k(self.waveform, self.sample_rate)
+        return self.__mono_16k
+
+    @property
+    def duration(self) -> float:
+        """Duration in seconds"""
+        return self.waveform.shape[-1] / self.sample_rate
+
+    def to_pyannote(self) -> dict:
+        """Returns the 16 kHz mono view in the in-memory format pyannote pipelines expect."""
+        return {
+            "waveform": self.mono_16k.unsqueeze(0),
+            "sample_rate": SAMPLE_RATE,
+        }
+
+
+def stream_mono_16k(
+    source: Union[BinaryIO, str, PathLike], chunk_duration: float = 10.0
+) -> Iterator["torch.Tensor"]:
+    """Decodes an audio file piece by piece.
+
+    Downmixing and resampling happen inside the decoder, so only one chunk of the
+    recording is held in memory at any time. Requires `torchaudio.io.StreamReader`,
+    which is deprecated in recent versions of torchaudio.
+
+    Args:
+        source (path-like object or file-like object): Audio to decode.
+        chunk_duration (float, optional): Duration of each chunk in seconds. Defaults to 10.0.
+
+    Yields:
+        torch.Tensor: Consecutive float32 chunks of the recording, downmixed to mono and resampled to 16 kHz.
+    """
+    try:
+        from torchaudio.io import StreamReader
+    except ImportError as e:
+        raise ImportError(
+            "Streaming decoding requires torchaudio.io.StreamReader, which this "
+            "version of torchaudio does not provide. Install the torchaudio version "
+            "pinned in requirements.txt."
+        ) from e
+
+    if isinstance(source, PathLike):
+        source = str(source)
+    reader = StreamReader(source)
+    reader.add_basic_audio_stream(
+        frames_per_chunk=int(chunk_duration * SAMPLE_RATE),
+        sample_rate=SAMPLE_RATE,
+        num_channels=1,
+    )
+    for (chunk,) in reader.stream():
+        yield chunk[:, 0]
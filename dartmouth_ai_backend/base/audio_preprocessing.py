@@ -0,0 +1,56 @@
+"""Downmixing and resampling of decoded audio in torch"""
+import functools
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import torch
+
+SAMPLE_RATE = 16_000
+
+
+def to_mono(waveform: "torch.Tensor") -> "torch.Tensor":
+    """Averages the channels of a waveform.
+
+    Args:
+        waveform (torch.Tensor): Waveform of shape (channel, time) or (time,).
+
+    Returns:
+        torch.Tensor: The float32 waveform of shape (time,). A waveform that already
+        is mono and float32 is returned as a view, without copying.
+    """
+    import torch
+
+    waveform = waveform.to(torch.float32)
+    if waveform.dim() == 1:
+        return waveform
+    if waveform.shape[0] == 1:
+        return waveform[0]
+    return waveform.mean(dim=0)
+
+
+@functools.lru_cache(maxsize=None)
+def resampler(orig_freq: int, new_freq: int = SAMPLE_RATE):
+    """Returns a resampling transform whose windowed sinc kernel is computed only once per pair of rates."""
+    import torch
+    import torchaudio
+
+    # Without an explicit type, the kernel would be converted on every call
+    return torchaudio.transforms.Resample(orig_freq, new_freq, dtype=torch.float32)
+
+
+def to_mono_16k(waveform: "torch.Tensor", sample_rate: int) -> "torch.Tensor":
+    """Downmixes a waveform to mono and resamples it to 16 kHz.
+
+    Downmixing happens first, so only a single channel has to be resampled.
+
+    Args:
+        waveform (torch.Tensor): Waveform of shape (channel, time) or (time,).
+        sample_rate (int): Sample rate of the waveform.
+
+    Returns:
+        torch.Tensor: The float32 waveform of shape (time,) at 16 kHz.
+    """
+    waveform = to_mono(waveform)
+    if sample_rate == SAMPLE_RATE:
+        return waveform
+    return resampler(sample_rate)(waveform)
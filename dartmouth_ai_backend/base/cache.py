@@ -0,0 +1,248 @@
+"""Content-addressed on-disk cache for analysis results"""
+import hashlib
+import io
+import json
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from os import PathLike
+from typing import Any, BinaryIO, Callable, Iterable, Sequence, Union
+
+_BLOCK_SIZE = 1 << 20
+# Stay below the limit on host parameters of older SQLite versions
+_MAX_PARAMS = 500
+
+
+def digest_text(text: str) -> str:
+    """Returns the SHA-256 digest of a text."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def digest_file(source: Union[BinaryIO, str, PathLike]) -> str:
+    """Returns the SHA-256 digest of a file's contents.
+
+    File-like objects are read from their current position and rewound afterwards,
+    so they can still be processed. `Audio` objects are digested by their waveform.
+
+    Args:
+        source (path-like object, file-like object, or Audio): The file to digest.
+
+    Returns:
+        str: The hex digest.
+    """
+    from .audio import Audio
+
+    sha = hashlib.sha256()
+    if isinstance(source, Audio):
+        sha.update(str(source.sample_rate).encode())
+        sha.update(source.waveform.numpy().tobytes())
+    elif isinstance(source, (str, PathLike)):
+        with open(source, "rb") as f:
+            for block in iter(lambda: f.read(_BLOCK_SIZE), b""):
+                sha.update(block)
+    elif isinstance(source, (bytes, bytearray, memoryview)):
+        sha.update(source)
+    else:
+        position = source.tell()
+        for block in iter(lambda: source.read(_BLOCK_SIZE), b""):
+            sha.update(block)
+        source.seek(position, io.SEEK_SET)
+    return sha.hexdigest()
+
+
+class ResultCache:
+    """Stores analysis results in an SQLite database, keyed by input and parameters.
+
+    A key is the hash of the input's contents, the model identifier, and the call
+    parameters, so re-processing unchanged inputs returns the stored result. When the
+    stored results exceed `max_size` bytes, the least recently used ones are evicted.
+    """
+
+    def __init__(
+        self, path: Union[str, PathLike] = ".cache/results.sqlite", max_size=2**30
+    ):
+        """Opens or creates a result cache
+
+        Args:
+            path (str, optional): Path to the database file. Defaults to `.cache/results.sqlite`.
+            max_size (int, optional): Maximum total size of the stored results in bytes. Defaults to 1 GiB.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(str(path), check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                "key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)"
+            )
+            self.__connection.execute(
+                "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)"
+            )
+        # Kept up to date on insert and evict, so storing a result does not scan the table
+        (self.__total,) = self.__connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()
+
+    @staticmethod
+    def key(digest: str, model: str, **params) -> str:
+        """Builds a cache key.
+
+        Args:
+            digest (str): Digest of the input, see `digest_text` and `digest_file`.
+            model (str): Identifier of the model that produces the result.
+            **params: Call parameters that affect the result.
+
+        Returns:
+            str: The cache key.
+        """
+        params = json.dumps(params, sort_keys=True, default=str)
+        return hashlib.sha256(f"{digest}\0{model}\0{params}".encode()).hexdigest()
+
+    def get(self, key: str, default=None) -> Any:
+        """Looks up a result and marks it as recently used."""
+        return self.get_many([key], default)[0]
+
+    def get_many(self, keys: Sequence[str], default=None) -> list:
+        """Looks up several results and marks them as recently used in one transaction.
+
+        Args:
+            keys (sequence of str): The cache keys.
+            default (optional): Value for keys without a stored result. Defaults to None.
+
+        Returns:
+            list: The results in the order of `keys`.
+        """
+        found = dict()
+        with self.__lock:
+            for start in range(0, len(keys), _MAX_PARAMS):
+                chunk = keys[start : start + _MAX_PARAMS]
+                found.update(
+                    self.__connection.execute(
+                        "SELECT key, value FROM results WHERE key IN "
+                        f"({', '.join('?' * len(chunk))})",
+                        chunk,
+                    ).fetchall()
+                )
+            hits = sum(key in found for key in keys)
+            self.hits += hits
+            self.misses += len(keys) - hits
+            if found:
+                now = time.time()
+                with self.__connection:
+                    self.__connection.executemany(
+                        "UPDATE results SET accessed = ? WHERE key = ?",
+                        ((now, key) for key in found),
+                    )
+        return [pickle.loads(found[key]) if key in found else default for key in keys]
+
+    def set(self, key: str, value: Any):
+        """Stores a result, evicting the least recently used ones if necessary."""
+        self.set_many([(key, value)])
+
+    def set_many(self, items: Iterable[tuple[str, Any]]):
+        """Stores several results in one transaction, evicting the least recently used ones if necessary.
+
+        Args:
+            items (iterable of (str, object) tuples): The keys and results to store.
+        """
+        rows = dict()
+        for key, value in items:
+            value = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            if len(value) <= self.max_size:
+                rows[key] = value
+        if not rows:
+            return
+        now = time.time()
+        with self.__lock, self.__connection:
+            for key, value in rows.items():
+                replaced = self.__connection.execute(
+                    "SELECT size FROM results WHERE key = ?", (key,)
+                ).fetchone()
+                if replaced is not None:
+                    self.__total -= replaced[0]
+                self.__connection.execute(
+                    "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)",
+                    (key, value, len(value), now),
+                )
+                self.__total += len(value)
+            self._evict()
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Returns the stored result for a key, or computes and stores it."""
+        missing = object()
+        result = self.get(key, default=missing)
+        if result is missing:
+            result = compute()
+            self.set(key, result)
+        return result
+
+    def map_batch(
+        self, keys: Sequence[str], compute_misses: Callable[[list[int]], Iterable]
+    ) -> list:
+        """Returns the stored results for a batch, computing and storing only the missing ones.
+
+        Args:
+            keys (sequence of str): The cache keys of the batch.
+            compute_misses (callable): Maps the indices of the keys without a stored result to their results, in the same order. Not called if every key has a stored result.
+
+        Returns:
+            list: The results in the order of `keys`.
+        """
+        missing = object()
+        results = self.get_many(keys, default=missing)
+        misses = [i for i, result in enumerate(results) if result is missing]
+        if misses:
+            for i, result in zip(misses, compute_misses(misses)):
+                results[i] = result
+            self.set_many((keys[i], results[i]) for i in misses)
+        return results
+
+    def _evict(self):
+        while self.__total > self.max_size:
+            rows = self.__connection.execute(
+                "SELECT key, size FROM results ORDER BY accessed LIMIT 64"
+            ).fetchall()
+            if not rows:
+                self.__total = 0
+                return
+            for key, size in rows:
+                self.__connection.execute("DELETE FROM results WHERE key = ?", (key,))
+                self.__total -= size
+                if self.__total <= self.max_size:
+                    return
+
+    @property
+    def size(self) -> int:
+        """Total size of the stored results in bytes"""
+        with self.__lock:
+            return self.__total
+
+    def stats(self) -> dict:
+        """Returns the hit and miss counts, the number of entries, and their total size."""
+        with self.__lock:
+            (entries,) = self.__connection.execute(
+                "SELECT COUNT(*) FROM results"
+            ).fetchone()
+            size = self.__total
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "entries": entries,
+            "size": size,
+        }
+
+    def clear(self):
+        """Removes all stored results and resets the counters."""
+        with self.__lock, self.__connection:
+            self.__connection.execute("DELETE FROM results")
+            self.__total = 0
+            self.hits = 0
+            self.misses = 0
+
+    def close(self):
+        self.__connection.close()
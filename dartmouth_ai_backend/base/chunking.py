@@ -0,0 +1,67 @@
+"""Splitting long texts into chunks that respect paragraph and sentence boundaries"""
+import re
+
+# From coarse to fine: paragraphs, sentences, words. Each boundary belongs to the
+# piece before it, so the pieces always tile the text.
+_BOUNDARIES = [
+    re.compile(r"\n[ \t]*\n\s*"),
+    re.compile(r"(?<=[.!?])[\"'”’)\]]*\s+"),
+    re.compile(r"\s+"),
+]
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """Approximates the number of spaCy tokens in a text by counting words and punctuation."""
+    return sum(1 for _ in _TOKEN.finditer(text))
+
+
+def chunk_text(text: str, max_tokens: int = 1000) -> list[tuple[int, int]]:
+    """Splits a text into consecutive chunks of at most `max_tokens` tokens.
+
+    Whole paragraphs are packed into a chunk as long as they fit. Paragraphs that
+    are too long are split between sentences, and sentences that are too long
+    between words. A single word longer than the budget becomes its own chunk.
+
+    Args:
+        text (str): The text to split.
+        max_tokens (int, optional): Token budget per chunk, as counted by `count_tokens`. Defaults to 1000.
+
+    Returns:
+        list[tuple[int, int]]: The (start, end) character offsets of the chunks. The
+        chunks tile the text without gaps, so joining them restores it exactly.
+    """
+    if max_tokens < 1:
+        raise ValueError("The token budget must be positive.")
+
+    chunks = []
+
+    def split(start: int, end: int, level: int):
+        if level == len(_BOUNDARIES):
+            chunks.append((start, end))
+            return
+
+        cuts = [
+            m.end()
+            for m in _BOUNDARIES[level].finditer(text, start, end)
+            if start < m.end() < end
+        ]
+        bounds = [start, *cuts, end]
+        current_start, current_tokens = start, 0
+        for piece_start, piece_end in zip(bounds, bounds[1:]):
+            tokens = count_tokens(text[piece_start:piece_end])
+            if current_tokens and current_tokens + tokens > max_tokens:
+                chunks.append((current_start, piece_start))
+                current_start, current_tokens = piece_start, 0
+            if tokens > max_tokens:
+                # Include pending pieces without tokens, such as leading blank lines
+                split(current_start, piece_end, level + 1)
+                current_start = piece_end
+                continue
+            current_tokens += tokens
+        if current_start < end:
+            chunks.append((current_start, end))
+
+    if text:
+        split(0, len(text), 0)
+    return chunks
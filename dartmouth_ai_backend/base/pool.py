@@ -0,0 +1,167 @@
+"""Process pool that runs one analyzer per worker process"""
+import functools
+import io
+import multiprocessing
+import os
+import sys
+from itertools import islice
+from os import PathLike
+from typing import Any, Callable, Iterable, Iterator, Optional, Union
+
+# State of the worker process, set up once by `_init_worker`
+_analyzer = None
+_method = None
+
+THREAD_VARIABLES = ["OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"]
+
+
+def _init_worker(factory: Callable[[], Any], method: str, num_threads: int):
+    global _analyzer, _method
+
+    # Takes effect for libraries that are imported while building the analyzer
+    for variable in THREAD_VARIABLES:
+        os.environ[variable] = str(num_threads)
+    _analyzer = factory()
+    _method = getattr(_analyzer, method)
+    if "torch" in sys.modules:
+        import torch
+
+        torch.set_num_threads(num_threads)
+
+
+def _open(item):
+    # Byte buffers are passed on as file-like objects, paths as they are
+    return io.BytesIO(item) if isinstance(item, (bytes, bytearray)) else item
+
+
+def _call(item, kwargs: dict, return_exceptions: bool):
+    try:
+        return _method(_open(item), **kwargs)
+    except Exception as e:
+        if return_exceptions:
+            return e
+        raise
+
+
+def _call_batch(batch: list, kwargs: dict, return_exceptions: bool) -> list:
+    try:
+        return list(_method([_open(item) for item in batch], **kwargs))
+    except Exception as e:
+        if return_exceptions:
+            return [e] * len(batch)
+        raise
+
+
+class AnalyzerPool:
+    """Runs an analyzer in several worker processes.
+
+    Each worker builds the analyzer once, by calling `factory`, and keeps it for
+    all tasks, so models are loaded once per worker rather than once per task.
+    Torch and the BLAS libraries are limited to `threads_per_worker` threads in
+    each worker, so the workers do not compete for cores. Tasks are file paths or
+    byte buffers, which are cheap to send to a worker, and results are sent back
+    pickled.
+
+    Workers are started with the "spawn" method by default, so scripts using the
+    pool must guard their entry point with `if __name__ == "__main__":`.
+
+    Example:
+        >>> with AnalyzerPool(ObjectDetector, "detect", processes=4) as pool:
+        ...     for result in pool.map(paths, render=False):
+        ...         ...
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        method: str,
+        processes: Optional[int] = None,
+        threads_per_worker: Optional[int] = None,
+        batch_size: Optional[int] = None,
+        chunksize: int = 4,
+        start_method: str = "spawn",
+    ):
+        """Starts the worker processes
+
+        Args:
+            factory (callable): Builds the analyzer, e.g., `ObjectDetector` or `functools.partial(SpeechRecognizer, model="tiny")`. Must be picklable.
+            method (str): Name of the analyzer method to call, e.g., "detect" or "transcribe".
+            processes (int, optional): Number of worker processes. Defaults to the number of CPUs.
+            threads_per_worker (int, optional): Number of torch threads per worker. Defaults to None, in which case the CPUs are split evenly between the workers.
+            batch_size (int, optional): If set, `method` takes a list of items and returns an iterable of results, e.g., "detect_many", and each task is a batch of this many items. Defaults to None.
+            chunksize (int, optional): Number of tasks sent to a worker at a time. Defaults to 4.
+            start_method (str, optional): Multiprocessing start method. Defaults to "spawn".
+        """
+        cpus = os.cpu_count() or 1
+        if processes is None:
+            processes = cpus
+        if threads_per_worker is None:
+            threads_per_worker = max(1, cpus // processes)
+        self.processes = processes
+        self.threads_per_worker = threads_per_worker
+        self.batch_size = batch_size
+        self.chunksize = chunksize
+        self.__pool = multiprocessing.get_context(start_method).Pool(
+            processes,
+            initializer=_init_worker,
+            initargs=(factory, method, threads_per_worker),
+        )
+
+    def map(
+        self,
+        items: Iterable[Union[bytes, str, PathLike]],
+        ordered: bool = True,
+        return_exceptions: bool = False,
+        **kwargs,
+    ) -> Iterator:
+        """Processes items in the workers.
+
+        Args:
+            items (iterable of bytes, strings, or path-like objects): File paths, byte buffers, or texts to pass to the analyzer.
+            ordered (bool, optional): Yield the results in input order. Otherwise, results are yielded as soon as they are ready. Defaults to True.
+            return_exceptions (bool, optional): Yield exceptions raised for an item instead of raising them, so that one broken file does not stop a large job. Defaults to False.
+            **kwargs: Passed to the analyzer method.
+
+        Yields:
+            The result of the analyzer method for each item.
+        """
+        imap = self.__pool.imap if ordered else self.__pool.imap_unordered
+        if self.batch_size is None:
+            yield from imap(
+                functools.partial(
+                    _call, kwargs=kwargs, return_exceptions=return_exceptions
+                ),
+                items,
+                chunksize=self.chunksize,
+            )
+            return
+
+        items = iter(items)
+        batches = iter(lambda: list(islice(items, self.batch_size)), [])
+        for results in imap(
+            functools.partial(
+                _call_batch, kwargs=kwargs, return_exceptions=return_exceptions
+            ),
+            batches,
+            chunksize=self.chunksize,
+        ):
+            yield from results
+
+    def close(self):
+        """Waits for the pending tasks and stops the workers."""
+        self.__pool.close()
+        self.__pool.join()
+
+    def terminate(self):
+        """Stops the workers immediately."""
+        self.__pool.terminate()
+        self.__pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if exc_info[0] is None:
+            self.close()
+        else:
+            self.terminate()
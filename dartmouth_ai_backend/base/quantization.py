@@ -0,0 +1,93 @@
+"""Dynamic int8 quantization of torch models for CPU inference"""
+import logging
+import os
+from importlib.metadata import version
+from typing import Callable, Iterable, Optional
+
+from .runtime import RuntimeConfig
+
+QUANTIZATION_MODES = (None, "int8")
+
+
+def check_quantize(quantize: Optional[str], runtime: RuntimeConfig):
+    """Validates a `quantize` argument against the runtime it will be used with."""
+    if quantize not in QUANTIZATION_MODES:
+        raise ValueError(
+            f"Unsupported quantization mode {quantize!r}. "
+            f"Choose one of {QUANTIZATION_MODES}."
+        )
+    if quantize is not None and runtime.device != "cpu":
+        raise ValueError("Dynamic quantization is only supported on the CPU.")
+    if quantize is not None and runtime.dtype not in (None, "float32"):
+        raise ValueError("Quantized models cannot be cast to another type.")
+
+
+def _plain_linears(module):
+    """Replaces subclasses of `nn.Linear` with `nn.Linear`, which the quantizer can convert."""
+    import torch
+
+    for name, child in module.named_children():
+        if isinstance(child, torch.nn.Linear) and type(child) is not torch.nn.Linear:
+            linear = torch.nn.Linear(
+                child.in_features, child.out_features, bias=child.bias is not None
+            )
+            linear.weight = child.weight
+            linear.bias = child.bias
+            setattr(module, name, linear)
+        else:
+            _plain_linears(child)
+    return module
+
+
+def quantize_int8(model):
+    """Quantizes the linear layers of a model to int8 with dynamic activation scaling."""
+    import torch
+
+    model = _plain_linears(model.float().eval())
+    return torch.ao.quantization.quantize_dynamic(
+        model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def load_quantized(
+    name: str,
+    loader: Callable,
+    cache_dir: Optional[str] = None,
+    packages: Iterable[str] = (),
+):
+    """Loads a quantized model, quantizing and caching it on first use.
+
+    The whole module is pickled, so the cache file names the versions of torch and
+    of the packages that define the module. Upgrading any of them quantizes the
+    model again instead of unpickling classes that may have changed.
+
+    Args:
+        name (str): Name of the model, used for the cache file.
+        loader (callable): Called without arguments to load the unquantized model.
+        cache_dir (str, optional): Directory for the quantized model. Defaults to `~/.cache/dartmouth_ai_backend`.
+        packages (iterable of str, optional): Distributions that define the model's classes, e.g., "transformers". Defaults to ().
+
+    Returns:
+        torch.nn.Module: The quantized model.
+    """
+    import torch
+
+    if cache_dir is None:
+        cache_dir = os.path.expanduser("~/.cache/dartmouth_ai_backend")
+    versions = [f"torch-{torch.__version__}"]
+    versions.extend(f"{package}-{version(package)}" for package in packages)
+    tag = ".".join(versions).replace("+", "-")
+    path = os.path.join(cache_dir, f"{name.replace('/', '--')}.int8.{tag}.pt")
+
+    if os.path.exists(path):
+        logging.info(f"Loading quantized model from {path}")
+        return torch.load(path, map_location="cpu", weights_only=False)
+
+    logging.info(f"Quantizing {name}")
+    model = quantize_int8(loader())
+    os.makedirs(cache_dir, exist_ok=True)
+    # Write to a temporary file first, so that concurrent workers never read a partial file
+    temporary_path = f"{path}.{os.getpid()}.tmp"
+    torch.save(model, temporary_path)
+    os.replace(temporary_path, path)
+    return model
@@ -0,0 +1,280 @@
+"""Process-wide registry of loaded models"""
+import contextlib
+import gc
+import itertools
+import logging
+import threading
+from collections import deque
+from typing import Any, Callable, Hashable, Optional
+
+
+def _freeze(value) -> Hashable:
+    """Turns a (possibly nested) config value into something hashable."""
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        items = [_freeze(v) for v in value]
+        return tuple(sorted(items) if isinstance(value, (set, frozenset)) else items)
+    return value
+
+
+class ModelHandle:
+    """A reference to a model held by a `ModelRegistry`.
+
+    The model is loaded on the first call to `get` and shared with every other
+    handle acquired for the same name and config. If the registry evicts the model
+    to stay within its memory budget, the next call to `get` loads it again, so
+    callers should not hold on to the model between calls.
+    """
+
+    def __init__(self, registry: "ModelRegistry", key: Hashable):
+        self.__registry = registry
+        self.__key = key
+        self.__released = False
+
+    @property
+    def key(self) -> Hashable:
+        return self.__key
+
+    def get(self) -> Any:
+        """Returns the model, loading it if necessary."""
+        if self.__released:
+            raise RuntimeError("The model handle has already been released.")
+        return self.__registry._get(self.__key)
+
+    def release(self):
+        """Gives up this reference. The model is unloaded with the last reference."""
+        if not self.__released:
+            self.__released = True
+            self.__registry._release(self.__key)
+
+    def __del__(self):
+        # The garbage collector may run while this thread holds the registry's
+        # lock, so never wait for it here
+        if not self.__released:
+            self.__released = True
+            try:
+                self.__registry._release_later(self.__key)
+            except Exception:
+                pass
+
+
+class _Entry:
+    def __init__(self, loader: Callable[[], Any]):
+        self.loader = loader
+        self.model = None
+        self.loaded = False
+        self.size = 0
+        self.last_used = 0
+        self.refcount = 0
+        self.lock = threading.Lock()
+
+
+class ModelRegistry:
+    """Shares loaded models between all analyzers in a process.
+
+    Models are keyed by name and config, loaded lazily and reference-counted, so
+    one loaded model backs every analyzer that asks for the same name and config.
+
+    With a memory budget, the registry tracks the approximate resident size of each
+    loaded model and unloads the least recently used models whenever the total
+    exceeds the budget. Before a model is loaded again, room is made for the size it
+    had the last time. Unloaded models are loaded again on their next use. Models
+    are loaded one at a time while a budget is set, so that sizes measured from the
+    growth of the process do not include other models loading in parallel.
+    """
+
+    def __init__(self, memory_budget: Optional[int] = None):
+        """Initializes the registry
+
+        Args:
+            memory_budget (int, optional): Maximum total size of the loaded models in bytes. Defaults to None, in which case models stay loaded as long as they are referenced.
+        """
+        self.__lock = threading.Lock()
+        self.__pending_releases = deque()
+        self.__entries: dict[Hashable, _Entry] = dict()
+        self.__clock = itertools.count(1)
+        self.__load_lock = threading.Lock()
+        self.__memory_budget = memory_budget
+
+    @property
+    def memory_budget(self) -> Optional[int]:
+        return self.__memory_budget
+
+    @memory_budget.setter
+    def memory_budget(self, memory_budget: Optional[int]):
+        self.__memory_budget = memory_budget
+        self._evict()
+
+    @property
+    def resident_size(self) -> int:
+        """Approximate total size of the loaded models in bytes"""
+        with self._locked():
+            return sum(e.size for e in self.__entries.values() if e.loaded)
+
+    def acquire(self, name: str, loader: Callable[..., Any], **config) -> ModelHandle:
+        """Acquires a handle to a model.
+
+        Args:
+            name (str): Name of the model, e.g., "en_core_web_trf".
+            loader (callable): Called as `loader(name, **config)` to load the model on first use.
+            **config: Options that change the loaded model. Part of the key.
+
+        Returns:
+            ModelHandle: A handle to the shared model.
+        """
+        key = (name, _freeze(config))
+        with self._locked():
+            entry = self.__entries.get(key)
+            if entry is None:
+                entry = _Entry(lambda: loader(name, **config))
+                self.__entries[key] = entry
+            entry.refcount += 1
+        return ModelHandle(self, key)
+
+    def is_loaded(self, name: str, **config) -> bool:
+        """Checks whether a model is currently loaded."""
+        with self._locked():
+            entry = self.__entries.get((name, _freeze(config)))
+            return entry is not None and entry.loaded
+
+    def _get(self, key: Hashable) -> Any:
+        with self._locked():
+            entry = self.__entries[key]
+            entry.last_used = next(self.__clock)
+        with entry.lock:
+            if not entry.loaded:
+                if self.__memory_budget is None:
+                    self._load(key, entry, measure=False)
+                else:
+                    # Make room for the size the model had when it was last loaded
+                    self._evict(keep=key, reserve=entry.size)
+                    with self.__load_lock:
+                        self._load(key, entry, measure=True)
+            model = entry.model
+        self._evict(keep=key)
+        return model
+
+    @staticmethod
+    def _load(key: Hashable, entry: _Entry, measure: bool):
+        logging.info(f"Loading model {key[0]}")
+        resident_before = _resident_set_size() if measure else None
+        entry.model = entry.loader()
+        entry.size = _model_size(entry.model, resident_before)
+        entry.loaded = True
+
+    def _evict(self, keep: Optional[Hashable] = None, reserve: int = 0):
+        """Unloads the least recently used models until the loaded models fit the budget.
+
+        Args:
+            keep (Hashable, optional): Key of a model that must stay loaded. Defaults to None.
+            reserve (int, optional): Bytes to keep free in addition, e.g., for a model that is about to be loaded. Defaults to 0.
+        """
+        if self.__memory_budget is None:
+            return
+        with self._locked():
+            loaded = [(k, e) for k, e in self.__entries.items() if e.loaded]
+            total = sum(e.size for _, e in loaded) + reserve
+            candidates = sorted(
+                ((k, e) for k, e in loaded if k != keep),
+                key=lambda item: item[1].last_used,
+            )
+        evicted = False
+        for key, entry in candidates:
+            if total <= self.__memory_budget:
+                break
+            # Skip models that are being loaded right now
+            if not entry.lock.acquire(blocking=False):
+                continue
+            try:
+                if entry.loaded:
+                    logging.info(
+                        f"Evicting model {key[0]} ({entry.size / 2**20:.0f} MiB)"
+                    )
+                    entry.model = None
+                    entry.loaded = False
+                    total -= entry.size
+                    evicted = True
+            finally:
+                entry.lock.release()
+        if evicted:
+            # Models often hold reference cycles, so collect them right away
+            gc.collect()
+
+    def _release(self, key: Hashable):
+        with self._locked():
+            self._decrement(key)
+
+    def _release_later(self, key: Hashable):
+        """Releases a reference without blocking, for handles that are finalized.
+
+        If the lock is taken, possibly by the thread the finalizer interrupted, the
+        release is applied the next time the lock is taken instead.
+        """
+        self.__pending_releases.append(key)
+        if self.__lock.acquire(blocking=False):
+            try:
+                self._drain_releases()
+            finally:
+                self.__lock.release()
+
+    @contextlib.contextmanager
+    def _locked(self):
+        with self.__lock:
+            self._drain_releases()
+            yield
+
+    def _drain_releases(self):
+        while self.__pending_releases:
+            self._decrement(self.__pending_releases.popleft())
+
+    def _decrement(self, key: Hashable):
+        entry = self.__entries.get(key)
+        if entry is None:
+            return
+        entry.refcount -= 1
+        if entry.refcount <= 0:
+            logging.info(f"Unloading model {key[0]}")
+            del self.__entries[key]
+
+
+def _resident_set_size() -> int:
+    """Returns the resident set size of the process in bytes."""
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+def _model_size(model, resident_before: Optional[int] = None) -> int:
+    """Estimates the memory a model occupies in bytes.
+
+    For torch modules, this is the size of the tensors in their state dict, which
+    also covers the packed weights of quantized layers. For other models, such as
+    spaCy or pyannote pipelines, it is the growth of the resident set size since
+    `resident_before`, or 0 if that is not given.
+    """
+    if hasattr(model, "parameters") and hasattr(model, "state_dict"):
+        tensors = dict()
+        pending = list(model.state_dict().values())
+        while pending:
+            value = pending.pop()
+            if isinstance(value, (tuple, list)):
+                pending.extend(value)
+            elif hasattr(value, "data_ptr"):
+                # Tied weights share their storage
+                tensors[value.data_ptr()] = value.numel() * value.element_size()
+        if tensors:
+            return sum(tensors.values())
+    if resident_before is None:
+        return 0
+    return max(_resident_set_size() - resident_before, 0)
+
+
+default_registry = ModelRegistry()
+
+
+def load_spacy(name: str, **config):
+    """Loads a spaCy pipeline. Suitable as a `loader` for `ModelRegistry.acquire`."""
+    import spacy
+
+    return spacy.load(name, **config)
@@ -0,0 +1,153 @@
+"""Inference runtime settings shared by the torch-backed analyzers"""
+import contextlib
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Optional
+
+# Thread count set by `limit_threads` for the calling thread
+_local = threading.local()
+
+
+@dataclass
+class RuntimeConfig:
+    """How and where torch models run.
+
+    Attributes:
+        inference_mode (bool): Run forward passes under `torch.inference_mode` instead of `torch.no_grad`. Defaults to True.
+        num_threads (int, optional): Number of intra-op threads used during forward passes. Defaults to None, leaving torch's setting unchanged.
+        num_interop_threads (int, optional): Number of inter-op threads. Can only be set once per process, before any parallel work. Defaults to None.
+        device (str): Device to use for inference. Can be "cpu", "mps", or "cuda". Defaults to "cpu".
+        dtype (str, optional): Floating point type of the model, e.g., "float32" or "bfloat16". Defaults to None, leaving the model's type unchanged.
+    """
+
+    inference_mode: bool = True
+    num_threads: Optional[int] = None
+    num_interop_threads: Optional[int] = None
+    device: str = "cpu"
+    dtype: Optional[str] = None
+
+    def apply(self):
+        """Applies the process-wide thread settings."""
+        import torch
+
+        if self.num_threads is not None:
+            torch.set_num_threads(self.num_threads)
+        if (
+            self.num_interop_threads is not None
+            and torch.get_num_interop_threads() != self.num_interop_threads
+        ):
+            try:
+                torch.set_num_interop_threads(self.num_interop_threads)
+            except RuntimeError:
+                logging.warning(
+                    "The number of inter-op threads can only be set before any "
+                    "parallel work has started; keeping "
+                    f"{torch.get_num_interop_threads()}."
+                )
+
+    @property
+    def torch_dtype(self):
+        import torch
+
+        return None if self.dtype is None else getattr(torch, self.dtype)
+
+    def prepare(self, model):
+        """Moves a model to the configured device and type and switches it to evaluation mode."""
+        model = model.to(device=self.device, dtype=self.torch_dtype)
+        model.eval()
+        return model
+
+    def prepare_inputs(self, inputs: dict) -> dict:
+        """Moves model inputs to the configured device, casting floating point tensors to the configured type."""
+        import torch
+
+        prepared = dict()
+        for name, value in inputs.items():
+            if isinstance(value, torch.Tensor):
+                dtype = self.torch_dtype if value.is_floating_point() else None
+                value = value.to(device=self.device, dtype=dtype)
+            prepared[name] = value
+        return prepared
+
+    @contextlib.contextmanager
+    def inference(self):
+        """Context for a forward pass: disables autograd and applies the thread count.
+
+        Inside `limit_threads`, the thread count set there takes precedence over
+        `num_threads`.
+        """
+        import torch
+
+        num_threads = getattr(_local, "num_threads", None) or self.num_threads
+        if num_threads is not None:
+            # Thread counts are per-thread with OpenMP, so apply them where the
+            # forward pass runs
+            torch.set_num_threads(num_threads)
+        grad_mode = torch.inference_mode() if self.inference_mode else torch.no_grad()
+        with grad_mode:
+            yield
+
+
+@contextlib.contextmanager
+def limit_threads(num_threads: int):
+    """Runs a block with a fixed torch thread count in the calling thread.
+
+    The count overrides `RuntimeConfig.num_threads` for forward passes in the block,
+    so that stages running in parallel threads keep their share of the cores.
+
+    Args:
+        num_threads (int): Number of intra-op threads.
+    """
+    import torch
+
+    previous = getattr(_local, "num_threads", None)
+    _local.num_threads = num_threads
+    torch.set_num_threads(num_threads)
+    try:
+        yield
+    finally:
+        _local.num_threads = previous
+
+
+def check_dtype(runtime: RuntimeConfig, supported: tuple[str, ...], analyzer: str):
+    """Validates the type of a runtime against the types an analyzer can run in.
+
+    Args:
+        runtime (RuntimeConfig): The runtime passed to the analyzer.
+        supported (tuple[str, ...]): Types the analyzer can apply.
+        analyzer (str): Name of the analyzer, for the error message.
+
+    Raises:
+        ValueError: If the runtime sets a type the analyzer cannot apply.
+    """
+    if runtime.dtype is not None and runtime.dtype not in supported:
+        raise ValueError(
+            f"{analyzer} cannot run in {runtime.dtype}. "
+            f"Choose one of {supported}, or leave the type unset."
+        )
+
+
+def resolve_runtime(
+    runtime: Optional[RuntimeConfig], device: Optional[str] = None
+) -> RuntimeConfig:
+    """Returns the runtime of an analyzer that also accepts a `device` argument.
+
+    Args:
+        runtime (RuntimeConfig, optional): The runtime passed to the analyzer.
+        device (str, optional): The device passed to the analyzer. Defaults to None.
+
+    Returns:
+        RuntimeConfig: `runtime`, or a default runtime on `device` ("cpu" if not set).
+
+    Raises:
+        ValueError: If both are given and `device` differs from the runtime's device.
+    """
+    if runtime is None:
+        return RuntimeConfig(device=device or "cpu")
+    if device is not None and device != runtime.device:
+        raise ValueError(
+            f"The device {device!r} conflicts with the device of the runtime "
+            f"({runtime.device!r}). Set the device on the runtime only."
+        )
+    return runtime
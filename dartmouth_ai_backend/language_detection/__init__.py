@@ -1,4 +1,17 @@
 """ Language detection """
-from .ld import LanguageDetector
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .ld import LanguageDetector
+
 
 __all__ = ["LanguageDetector"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "LanguageDetector":
+        from .ld import LanguageDetector
+
+        return LanguageDetector
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
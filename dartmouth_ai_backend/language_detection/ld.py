@@ -1,26 +1,121 @@
-import spacy
-import spacy_fastlang  # Ignore warning about unused import!
+from ..base.cache import ResultCache, digest_text
+
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
 
 class LanguageDetector:
     """Detects the language a text is written in."""
 
-    def __init__(self):
+    def __init__(self, cache: Optional[ResultCache] = None, fast: bool = False):
+        """Initializes the Language Detector
+
+        Args:
+            cache (ResultCache, optional): Cache to store results in and look them up from. Defaults to None.
+            fast (bool, optional): Run the fastText model on the raw text directly, skipping the construction of a spaCy `Doc`. The results are the same, including the threshold and default language of the spaCy component. Defaults to False.
+        """
+        import spacy
+        import spacy_fastlang  # Ignore warning about unused import!
+
         self.__nlp = spacy.blank("xx")
         self.__nlp.add_pipe("language_detector")
+        self.__component = self.__nlp.get_pipe("language_detector")
+        self.__fast = fast
+        self.__cache = cache
 
-    def detect(self, text: str) -> dict:
+    def detect(self, text: str, top_k: Optional[int] = None) -> dict:
         """Detects the language a text is written in.
 
         Args:
             text (string): The text to be analyzed.
+            top_k (int, optional): Also return the `top_k` most likely languages. The spaCy component only reports the most likely language, so with `top_k` the fastText model always runs directly, as with `fast`. Defaults to None.
 
         Returns:
-            dict: A dictionary containing the keys language and score.
+            dict: A dictionary containing the keys language and score, and languages, a list of dictionaries with the keys language and score, if `top_k` is set.
+        """
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                self._key(text, top_k, self.__fast), lambda: self._detect(text, top_k)
+            )
+        return self._detect(text, top_k)
+
+    def detect_many(
+        self, texts: Iterable[str], batch_size: int = 1024, top_k: Optional[int] = None
+    ) -> Iterator[dict]:
+        """Detects the language of each text in a collection.
+
+        The texts are classified in batches with a single call into fastText, which
+        keeps the per-text overhead small for large collections of short texts.
+
+        Args:
+            texts (iterable of strings): The texts to be analyzed.
+            batch_size (int, optional): Number of texts per batch. Defaults to 1024.
+            top_k (int, optional): Also return the `top_k` most likely languages. See `detect`. Defaults to None.
+
+        Yields:
+            dict: The result for each text, in input order, in the same format as `detect`.
         """
+        texts = iter(texts)
+        while batch := list(islice(texts, batch_size)):
+            if self.__cache is None:
+                yield from self._detect_batch(batch, top_k)
+                continue
+
+            # Only run the model on the cache misses
+            keys = [self._key(text, top_k, self.__fast) for text in batch]
+            yield from self.__cache.map_batch(
+                keys,
+                lambda misses: self._detect_batch([batch[i] for i in misses], top_k),
+            )
+
+    @staticmethod
+    def _key(text: str, top_k: Optional[int], fast: bool = False) -> str:
+        params = dict() if top_k is None else {"top_k": top_k}
+        return ResultCache.key(digest_text(text), "spacy_fastlang", fast=fast, **params)
+
+    def _detect(self, text: str, top_k: Optional[int] = None) -> dict:
+        if self.__fast or top_k is not None:
+            return self._detect_batch([text], top_k)[0]
         detected = self.__nlp(text)
         return {"language": detected._.language, "score": detected._.language_score}
 
+    def _detect_batch(self, texts: list[str], top_k: Optional[int] = None) -> list:
+        if not (self.__fast or top_k is not None):
+            return [
+                {"language": doc._.language, "score": doc._.language_score}
+                for doc in self.__nlp.pipe(texts, batch_size=len(texts))
+            ]
+
+        # fastText predicts one line at a time, like the spaCy component
+        labels, scores = self.__component.model.predict(
+            [text.replace("\n", " ") for text in texts], k=top_k or 1
+        )
+        results = []
+        for text_labels, text_scores in zip(labels, scores):
+            languages = [
+                # The raw fastText score, which the spaCy component reports as well
+                {"language": label.removeprefix("__label__"), "score": score}
+                for label, score in zip(text_labels, text_scores)
+            ]
+            result = {
+                "language": self._fallback(**languages[0]),
+                "score": languages[0]["score"],
+            }
+            if top_k is not None:
+                result["languages"] = languages
+            results.append(result)
+        return results
+
+    def _fallback(self, language: str, score: float) -> str:
+        """Applies the threshold and supported languages of the spaCy component."""
+        component = self.__component
+        if score <= component.threshold:
+            return component.default_language
+        supported = component.supported_languages
+        if supported is not None and language not in supported:
+            return component.default_language
+        return language
+
     @staticmethod
     def how_to_cite(format="bibtex") -> str:
         if format != "bibtex":
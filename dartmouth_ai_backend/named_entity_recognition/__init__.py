@@ -1,6 +1,18 @@
 """Named Entity Recognition
 """
-from .ner import NamedEntityRecognizer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .ner import NamedEntityRecognizer
 
 
 __all__ = ["NamedEntityRecognizer"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "NamedEntityRecognizer":
+        from .ner import NamedEntityRecognizer
+
+        return NamedEntityRecognizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
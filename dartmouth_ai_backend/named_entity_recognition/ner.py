@@ -1,20 +1,166 @@
 """ Named Entity Recognition """
-import spacy
-from spacy import displacy
+from ..base.cache import ResultCache, digest_text
+from ..base.chunking import chunk_text
+from ..base.registry import default_registry, load_spacy
+
+from itertools import islice
+from typing import Iterable, Iterator, Optional
+
+MODEL = "en_core_web_trf"
+
+
+def merge_chunks(docs: Iterable):
+    """Joins the docs of consecutive chunks of a text into a single doc.
+
+    The chunks must tile the text, as those from `chunk_text` do, so that the
+    character offsets of the merged doc, and of its entities, refer to the text. The
+    transformer output of each chunk is dropped as soon as the chunk is done, so it
+    never accumulates for the whole text.
+    """
+    from spacy.tokens import Doc
+
+    stripped = []
+    for doc in docs:
+        doc.user_data.clear()
+        doc.tensor = doc.tensor[:0]
+        stripped.append(doc)
+    return Doc.from_docs(
+        stripped, ensure_whitespace=False, exclude=["tensor", "user_data"]
+    )
 
 
 class NamedEntityRecognizer:
-    def __init__(self, lang="en"):
+    def __init__(self, lang="en", cache: Optional[ResultCache] = None):
         if lang != "en":
             raise NotImplementedError(
                 "Named Entity Recognition is currently "
                 "only supported for English texts."
             )
 
-        self.__nlp = spacy.load("en_core_web_trf", disable=["parser"])
+        self.__nlp = default_registry.acquire(MODEL, load_spacy, disable=["parser"])
+        self.__cache = cache
+
+    def recognize(
+        self,
+        text,
+        chunk_tokens: Optional[int] = None,
+        batch_size: int = 8,
+        render: bool = False,
+    ) -> dict:
+        """Recognizes named entities in a text.
+
+        Args:
+            text (string): The text to be analyzed.
+            chunk_tokens (int, optional): Split long texts into paragraph- or sentence-aligned chunks of about this many tokens, which run through the pipeline in batches. Memory use then depends on the chunk size instead of the length of the text. Defaults to None, in which case the whole text is processed at once.
+            batch_size (int, optional): Number of chunks per batch. Defaults to 8.
+            render (bool, optional): Also render the entities as HTML with displaCy. Use `NamedEntityRecognizer.render` to render stored entities later instead. Defaults to False.
+
+        Returns:
+            dict: The explanations of the entity labels ("tag_key"), the entities ("entities") with their text ("text"), label ("label"), and character offsets ("start_char", "end_char"), and, if `render` is True, the rendered entities ("html").
+        """
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                self._key(text, render, chunk_tokens),
+                lambda: self._format(
+                    self._recognize(text, chunk_tokens, batch_size), render
+                ),
+            )
+        return self._format(self._recognize(text, chunk_tokens, batch_size), render)
+
+    @staticmethod
+    def _key(text, render: bool, chunk_tokens: Optional[int] = None) -> str:
+        params = dict() if chunk_tokens is None else {"chunk_tokens": chunk_tokens}
+        return ResultCache.key(digest_text(text), MODEL, render=render, **params)
+
+    def _recognize(self, text, chunk_tokens: Optional[int], batch_size: int):
+        nlp = self.__nlp.get()
+        if chunk_tokens is None:
+            return nlp(text)
+        spans = chunk_text(text, chunk_tokens)
+        if len(spans) <= 1:
+            return nlp(text)
+        return merge_chunks(
+            nlp.pipe((text[start:end] for start, end in spans), batch_size=batch_size)
+        )
+
+    def recognize_many(
+        self,
+        texts: Iterable[str],
+        batch_size: int = 32,
+        n_process: int = 1,
+        render: bool = False,
+    ) -> Iterator[dict]:
+        """Recognizes named entities in a collection of texts.
+
+        The texts are streamed through the pipeline in batches, so the transformer
+        runs one padded forward pass per batch instead of one per text.
+
+        Args:
+            texts (iterable of strings): The texts to be analyzed.
+            batch_size (int, optional): Number of texts per batch. Defaults to 32.
+            n_process (int, optional): Number of processes to use. Defaults to 1.
+            render (bool, optional): Also render the entities as HTML with displaCy. Defaults to False.
+
+        Yields:
+            dict: The result for each text, in input order, in the same format as `recognize`.
+        """
+        if self.__cache is None:
+            for recognized in self.__nlp.get().pipe(
+                texts, batch_size=batch_size, n_process=n_process
+            ):
+                yield self._format(recognized, render)
+            return
+
+        # Look up each batch in the cache and only run the pipeline on the misses
+        texts = iter(texts)
+        while batch := list(islice(texts, batch_size)):
+            keys = [self._key(text, render) for text in batch]
+            yield from self.__cache.map_batch(
+                keys,
+                lambda misses: (
+                    self._format(doc, render)
+                    for doc in self.__nlp.get().pipe(
+                        (batch[i] for i in misses),
+                        batch_size=batch_size,
+                        n_process=n_process,
+                    )
+                ),
+            )
+
+    @staticmethod
+    def render(text: str, entities: list[dict]) -> str:
+        """Renders entities as HTML with displaCy.
+
+        Args:
+            text (string): The text the entities were recognized in.
+            entities (list[dict]): Entities with the keys "label", "start_char", and "end_char", e.g., the "entities" returned by `recognize`.
+
+        Returns:
+            str: The HTML markup.
+        """
+        from spacy import displacy
+
+        return displacy.render(
+            {
+                "text": text,
+                "ents": [
+                    {
+                        "start": entity["start_char"],
+                        "end": entity["end_char"],
+                        "label": entity["label"],
+                    }
+                    for entity in entities
+                ],
+                "title": None,
+            },
+            style="ent",
+            manual=True,
+        )
+
+    @staticmethod
+    def _format(recognized, render: bool = False) -> dict:
+        import spacy
 
-    def recognize(self, text):
-        recognized = self.__nlp(text)
         tags = set()
 
         for entity in recognized.ents:
@@ -22,7 +168,19 @@ class NamedEntityRecognizer:
 
         result = dict()
         result["tag_key"] = {tag: spacy.explain(tag) for tag in sorted(tags)}
-        result["html"] = displacy.render(recognized, style="ent")
+        result["entities"] = [
+            {
+                "text": entity.text,
+                "label": entity.label_,
+                "start_char": entity.start_char,
+                "end_char": entity.end_char,
+            }
+            for entity in recognized.ents
+        ]
+        if render:
+            from spacy import displacy
+
+            result["html"] = displacy.render(recognized, style="ent")
 
         return result
 
@@ -1,6 +1,23 @@
 """Object Detection in images
 """
-from .object_detection import ObjectDetector
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from .object_detection import ObjectDetector
+    from .rendering import AnnotationRenderer
 
-__all__ = ["ObjectDetector"]
+
+__all__ = ["AnnotationRenderer", "ObjectDetector"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "ObjectDetector":
+        from .object_detection import ObjectDetector
+
+        return ObjectDetector
+    if name == "AnnotationRenderer":
+        from .rendering import AnnotationRenderer
+
+        return AnnotationRenderer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -1,63 +1,394 @@
-from transformers import YolosImageProcessor, YolosForObjectDetection
-from PIL import Image, ImageDraw, ImageFont
-import torch
+from ..base.cache import ResultCache, digest_file
+from ..base.quantization import check_quantize, load_quantized
+from ..base.registry import default_registry
+from ..base.runtime import RuntimeConfig
+from .preprocessing import open_reduced
+from .rendering import AnnotationRenderer
+from .tiling import non_max_suppression, tile_boxes
 
-import base64
-import io
-from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
+MODEL = "hustvl/yolos-tiny"
 
-def px_to_pt(px):
-    return px * 0.75
+
+def _load_model(name: str, model_cache=None, quantize=None, device="cpu", dtype=None):
+    """Loads YOLOS. Suitable as a `loader` for `ModelRegistry.acquire`."""
+    from transformers import YolosForObjectDetection
+
+    if quantize is None:
+        model = YolosForObjectDetection.from_pretrained(name, cache_dir=model_cache)
+    else:
+        model = load_quantized(
+            name,
+            lambda: YolosForObjectDetection.from_pretrained(
+                name, cache_dir=model_cache
+            ),
+            cache_dir=model_cache,
+            packages=["transformers"],
+        )
+    return RuntimeConfig(device=device, dtype=dtype).prepare(model)
 
 
 class ObjectDetector:
-    def __init__(self, model_cache=None):
-        self.__model = YolosForObjectDetection.from_pretrained(
-            "hustvl/yolos-tiny", cache_dir=model_cache
+    def __init__(
+        self,
+        model_cache=None,
+        cache: Optional[ResultCache] = None,
+        reduced_decode=False,
+        runtime: Optional[RuntimeConfig] = None,
+        quantize: Optional[str] = None,
+    ):
+        """Initializes the Object Detector
+
+        The model is loaded on first use through the shared model registry.
+
+        Args:
+            model_cache (str, optional): Path to download the model files or load them from. Defaults to None.
+            cache (ResultCache, optional): Cache to store results in and look them up from. Defaults to None.
+            reduced_decode (bool, optional): Decode large images at no more than the resolution the model sees, which is faster for large photos and scans. Bounding boxes still refer to the original image, but annotated images have the reduced size. Defaults to False.
+            runtime (RuntimeConfig, optional): Device, type, and thread settings for inference. Defaults to None, in which case the model runs on the CPU.
+            quantize (str, optional): Set to "int8" to quantize the linear layers dynamically for faster CPU inference. The quantized model is cached in `model_cache`, or in `~/.cache/dartmouth_ai_backend` if that is not set. Defaults to None.
+        """
+        from transformers import YolosImageProcessor
+
+        self.__runtime = runtime or RuntimeConfig()
+        check_quantize(quantize, self.__runtime)
+        self.__runtime.apply()
+        self.__model = default_registry.acquire(
+            MODEL,
+            _load_model,
+            model_cache=model_cache,
+            quantize=quantize,
+            device=self.__runtime.device,
+            dtype=self.__runtime.dtype,
         )
+        self.__model_id = MODEL if quantize is None else f"{MODEL}/{quantize}"
         self.__image_processor = YolosImageProcessor.from_pretrained(
-            "hustvl/yolos-tiny", cache_dir=model_cache
+            MODEL, cache_dir=model_cache
         )
-        self.__relative_font_size = 0.1
+        self.__renderer = AnnotationRenderer(relative_font_size=0.1)
+        self.__cache = cache
+        self.__reduced_decode = reduced_decode
 
-    def detect(self, image):
-        image = Image.open(image)
+    def detect(
+        self,
+        image,
+        threshold=0.7,
+        render=True,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+    ) -> dict:
+        """Detects objects in an image.
 
-        inputs = self.__image_processor(images=image, return_tensors="pt")
-        outputs = self.__model(**inputs)
+        Args:
+            image (path-like object or file-like object): The image to be analyzed.
+            threshold (float, optional): Minimum score of a detection. Defaults to 0.7.
+            render (bool, optional): Include the annotated image ("annotated_image"). Defaults to True.
+            format (str, optional): Format of the annotated image. Defaults to the format of the source file.
+            quality (int, optional): Quality setting for encoding the annotated image. Defaults to None.
 
-        target_sizes = torch.tensor([image.size[::-1]])
-        results = self.__image_processor.post_process_object_detection(
-            outputs, threshold=0.7, target_sizes=target_sizes
-        )[0]
+        Returns:
+            dict: The score ("score") and bounding box ("bbox") of the highest-scoring object of each label, keyed by label, and the base64-encoded annotated image ("annotated_image") if requested and any objects were found.
+        """
+        options = dict(render=render, format=format, quality=quality)
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_file(image),
+                    self.__model_id,
+                    threshold=threshold,
+                    reduced_decode=self.__reduced_decode,
+                    **options,
+                ),
+                lambda: self._detect(image, threshold, **options),
+            )
+        return self._detect(image, threshold, **options)
 
-        objects = dict()
+    def detect_many(
+        self,
+        images: Iterable,
+        batch_size: int = 8,
+        threshold=0.7,
+        render=True,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+    ) -> Iterator[dict]:
+        """Detects objects in a collection of images.
+
+        The images are grouped into batches. Within a batch, images that have the same
+        size after preprocessing run through the model in a single forward pass.
+
+        Args:
+            images (iterable of path-like or file-like objects): The images to be analyzed.
+            batch_size (int, optional): Number of images per batch. Defaults to 8.
+            threshold (float, optional): Minimum score of a detection. Defaults to 0.7.
+            render (bool, optional): Include the annotated image. Defaults to True.
+            format (str, optional): Format of the annotated image. Defaults to the format of the source file.
+            quality (int, optional): Quality setting for encoding the annotated image. Defaults to None.
+
+        Yields:
+            dict: The result for each image, in input order, in the same format as `detect`.
+        """
+        options = dict(render=render, format=format, quality=quality)
+        images = iter(images)
+        while batch := list(islice(images, batch_size)):
+            if self.__cache is None:
+                yield from self._detect_batch(batch, threshold, **options)
+                continue
+
+            # Only run the model on the cache misses
+            keys = [
+                ResultCache.key(
+                    digest_file(image),
+                    self.__model_id,
+                    threshold=threshold,
+                    reduced_decode=self.__reduced_decode,
+                    **options,
+                )
+                for image in batch
+            ]
+            yield from self.__cache.map_batch(
+                keys,
+                lambda misses: self._detect_batch(
+                    [batch[i] for i in misses], threshold, **options
+                ),
+            )
+
+    def _detect(self, image, threshold, **options):
+        return self._detect_batch([image], threshold, **options)[0]
+
+    def _detect_batch(
+        self, images: list, threshold, render, format, quality
+    ) -> list[dict]:
+        from PIL import Image
+
+        if self.__reduced_decode:
+            size = self.__image_processor.size
+            opened = [
+                open_reduced(image, size["shortest_edge"], size["longest_edge"])
+                for image in images
+            ]
+        else:
+            opened = [(image, image.size) for image in map(Image.open, images)]
+
+        images = [image for image, _ in opened]
+        original_sizes = [original_size for _, original_size in opened]
+        detections = self._locate(images, threshold, target_sizes=original_sizes)
+        return [
+            self._format(image, detected, render, format, quality, original_size)
+            for image, detected, original_size in zip(
+                images, detections, original_sizes
+            )
+        ]
+
+    def detect_tiled(
+        self,
+        image,
+        threshold=0.7,
+        tile_size=1024,
+        overlap=128,
+        batch_size=8,
+        workers=1,
+        iou_threshold=0.5,
+        full_image=True,
+        render=True,
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+    ) -> dict:
+        """Detects objects in a large image tile by tile.
 
-        draw = ImageDraw.Draw(image)
-        font_path = str(
-            Path(__file__).parent.parent.resolve() / "resources/AppleGaramond.ttf"
+        The image is cut into overlapping tiles, which run through the model in
+        batches, so small objects keep enough pixels to be found. Detections are
+        mapped back to full-image coordinates, and duplicates from overlapping
+        tiles are removed with non-maximum suppression.
+
+        Args:
+            image (path-like object or file-like object): The image to be analyzed.
+            threshold (float, optional): Minimum score of a detection. Defaults to 0.7.
+            tile_size (int, optional): Edge length of the tiles in pixels. Defaults to 1024.
+            overlap (int, optional): Number of pixels adjacent tiles share. Defaults to 128.
+            batch_size (int, optional): Number of tiles per forward pass. Defaults to 8.
+            workers (int, optional): Number of batches to run in parallel threads. Defaults to 1.
+            iou_threshold (float, optional): Overlap above which two detections with the same label are merged. Defaults to 0.5.
+            full_image (bool, optional): Also run the model on the whole image to find objects larger than a tile. Defaults to True.
+            render (bool, optional): Include the annotated image. Defaults to True.
+            format (str, optional): Format of the annotated image. Defaults to the format of the source file.
+            quality (int, optional): Quality setting for encoding the annotated image. Defaults to None.
+
+        Returns:
+            dict: The result in the same format as `detect`, plus every detection that survived non-maximum suppression ("objects"), as a list of dicts with the label ("label"), score ("score"), and bounding box ("bbox"), sorted by descending score.
+        """
+        tiling = dict(
+            tile_size=tile_size,
+            overlap=overlap,
+            batch_size=batch_size,
+            workers=workers,
+            iou_threshold=iou_threshold,
+            full_image=full_image,
         )
+        options = dict(render=render, format=format, quality=quality)
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_file(image),
+                    self.__model_id,
+                    threshold=threshold,
+                    **tiling,
+                    **options,
+                ),
+                lambda: self._detect_tiled(image, threshold, tiling, options),
+            )
+        return self._detect_tiled(image, threshold, tiling, options)
+
+    def _detect_tiled(self, image, threshold, tiling: dict, options: dict) -> dict:
+        from PIL import Image
+
+        image = Image.open(image)
+        image.load()  # Decode once, before the tiles are cropped in parallel
+
+        tiles = tile_boxes(*image.size, tiling["tile_size"], tiling["overlap"])
+        batches = [
+            tiles[i : i + tiling["batch_size"]]
+            for i in range(0, len(tiles), tiling["batch_size"])
+        ]
+
+        def locate(boxes):
+            detections = self._locate([image.crop(box) for box in boxes], threshold)
+            shifted = []
+            for (left, upper, _, _), detected in zip(boxes, detections):
+                for detection in detected:
+                    x0, y0, x1, y1 = detection["bbox"]
+                    detection["bbox"] = [
+                        round(x0 + left, 2),
+                        round(y0 + upper, 2),
+                        round(x1 + left, 2),
+                        round(y1 + upper, 2),
+                    ]
+                    shifted.append(detection)
+            return shifted
+
+        if tiling["workers"] > 1:
+            with ThreadPoolExecutor(max_workers=tiling["workers"]) as executor:
+                detections = [
+                    d for found in executor.map(locate, batches) for d in found
+                ]
+        else:
+            detections = [d for boxes in batches for d in locate(boxes)]
+
+        if tiling["full_image"] and len(tiles) > 1:
+            detections.extend(self._locate([image], threshold)[0])
 
-        for score, label, box in zip(
-            results["scores"], results["labels"], results["boxes"]
-        ):
-            box = [round(i, 2) for i in box.tolist()]
-            label_name = self.__model.config.id2label[label.item()]
-
-            font_size_px = (box[3] - box[1]) * self.__relative_font_size
-            font = ImageFont.truetype(font_path, size=px_to_pt(font_size_px))
-            draw.rectangle(box, outline="green", width=2)
-            draw.text(box[:2], label_name, fill="green", font=font)
-            byte_buffer = io.BytesIO()
-            image.save(byte_buffer, format=image.format)
-            objects[label_name] = {"score": score.item(), "bbox": box}
-            objects["annotated_image"] = base64.b64encode(
-                byte_buffer.getvalue()
-            ).decode()
+        detections = non_max_suppression(detections, tiling["iou_threshold"])
+        result = self._format(image, detections, **options)
+        # A large scan often holds several objects with the same label
+        result["objects"] = detections
+        return result
 
+    def _format(
+        self,
+        image,
+        detections: list[dict],
+        render,
+        format,
+        quality,
+        original_size: Optional[tuple[int, int]] = None,
+    ):
+        # Keep the highest-scoring box of each label
+        objects = dict()
+        for detection in detections:
+            label = detection["label"]
+            if label not in objects or detection["score"] > objects[label]["score"]:
+                objects[label] = {
+                    "score": detection["score"],
+                    "bbox": detection["bbox"],
+                }
+        if render and detections:
+            if original_size is not None and original_size != image.size:
+                # The image was decoded at a reduced size, so scale the boxes to it
+                scale_x = image.size[0] / original_size[0]
+                scale_y = image.size[1] / original_size[1]
+                detections = [
+                    {
+                        **detection,
+                        "bbox": [
+                            x * scale
+                            for x, scale in zip(
+                                detection["bbox"], [scale_x, scale_y] * 2
+                            )
+                        ],
+                    }
+                    for detection in detections
+                ]
+            objects["annotated_image"] = self.__renderer.render(
+                image, detections, format=format, quality=quality
+            )
         return objects
 
+    def _locate(
+        self, images: list, threshold, target_sizes: Optional[list] = None
+    ) -> list[list[dict]]:
+        """Runs the model on a batch of images.
+
+        YOLOS has no padding mask, so padding an image to the size of a larger one
+        changes its detections. Images are therefore grouped by their size after
+        preprocessing, and each group runs through the model in one forward pass.
+
+        Args:
+            images (list[PIL.Image.Image]): The images to be analyzed.
+            threshold (float): Minimum score of a detection.
+            target_sizes (list[tuple[int, int]], optional): (width, height) of the images the bounding boxes should refer to. Defaults to the sizes of `images`.
+
+        Returns:
+            list[list[dict]]: The label ("label"), score ("score"), and bounding box ("bbox") of every detection in each image.
+        """
+        import torch
+
+        model = self.__model.get()
+        pixel_values = [
+            self.__image_processor(images=image, return_tensors="pt")["pixel_values"]
+            for image in images
+        ]
+        groups = dict()
+        for i, values in enumerate(pixel_values):
+            groups.setdefault(tuple(values.shape[-2:]), []).append(i)
+
+        if target_sizes is None:
+            target_sizes = [image.size for image in images]
+        results = [None] * len(images)
+        for indices in groups.values():
+            inputs = {"pixel_values": torch.cat([pixel_values[i] for i in indices])}
+            with self.__runtime.inference():
+                outputs = model(**self.__runtime.prepare_inputs(inputs))
+            group_results = self.__image_processor.post_process_object_detection(
+                outputs,
+                threshold=threshold,
+                target_sizes=torch.tensor(
+                    [target_sizes[i][::-1] for i in indices],
+                    device=self.__runtime.device,
+                ),
+            )
+            for i, result in zip(indices, group_results):
+                results[i] = result
+
+        id2label = model.config.id2label
+        return [
+            [
+                {
+                    "label": id2label[label],
+                    "score": score,
+                    "bbox": [round(i, 2) for i in box],
+                }
+                for score, label, box in zip(
+                    result["scores"].tolist(),
+                    result["labels"].tolist(),
+                    result["boxes"].tolist(),
+                )
+            ]
+            for result in results
+        ]
+
     @staticmethod
     def how_to_cite(format="bibtex") -> str:
         if format != "bibtex":
@@ -0,0 +1,63 @@
+import math
+
+
+def reduction_scale(width: int, height: int, shortest_edge: int, longest_edge: int):
+    """Returns the factor by which the image processor will scale an image.
+
+    The processor scales the shortest edge to `shortest_edge`, unless that would make
+    the longest edge exceed `longest_edge`. Images are never enlarged here, so the
+    factor is at most 1.
+    """
+    scale = shortest_edge / min(width, height)
+    if max(width, height) * scale > longest_edge:
+        scale = longest_edge / max(width, height)
+    return min(scale, 1.0)
+
+
+def open_reduced(source, shortest_edge: int, longest_edge: int):
+    """Opens an image at no more than the resolution the model will see.
+
+    JPEG files are decoded at a reduced scale directly (`Image.draft`), so the full
+    resolution bitmap is never held in memory. Other formats are decoded and then
+    downsampled by an integer factor (`Image.reduce`), which is cheaper than the
+    processor's resize. Bitonal, palette, and 16-bit images are converted to a mode
+    `Image.reduce` supports first.
+
+    Args:
+        source (path-like object or file-like object): The image to open.
+        shortest_edge (int): Target length of the shortest edge of the image processor.
+        longest_edge (int): Maximum length of the longest edge of the image processor.
+
+    Returns:
+        tuple[PIL.Image.Image, tuple[int, int]]: The (possibly) reduced image and the
+        size of the original image.
+    """
+    from PIL import Image
+
+    image = Image.open(source)
+    original_size = image.size
+    scale = reduction_scale(*original_size, shortest_edge, longest_edge)
+    if scale >= 0.5:
+        return image, original_size
+
+    image_format = image.format
+    if image_format == "JPEG":
+        # The decoder picks the smallest scale (1/2, 1/4, or 1/8) that is still at
+        # least as large as the requested size
+        image.draft(
+            image.mode,
+            (
+                math.ceil(original_size[0] * scale),
+                math.ceil(original_size[1] * scale),
+            ),
+        )
+    else:
+        if image.mode == "1":
+            image = image.convert("L")
+        elif image.mode == "P":
+            image = image.convert("RGBA" if "transparency" in image.info else "RGB")
+        elif image.mode.startswith("I;16"):
+            image = image.convert("I")
+        image = image.reduce(math.floor(1 / scale))
+        image.format = image_format
+    return image, original_size
@@ -0,0 +1,106 @@
+import base64
+import io
+from pathlib import Path
+from typing import Iterable, Optional, Union
+
+FONT_PATH = str(Path(__file__).parent.parent.resolve() / "resources/AppleGaramond.ttf")
+
+
+def px_to_pt(px):
+    return px * 0.75
+
+
+class AnnotationRenderer:
+    """Draws detected objects onto an image and encodes the result."""
+
+    def __init__(self, relative_font_size=0.1, color="green"):
+        """Initializes the renderer
+
+        Args:
+            relative_font_size (float, optional): Height of the label relative to the height of its box. Defaults to 0.1.
+            color (str, optional): Color of the boxes and labels. Defaults to "green".
+        """
+        self.relative_font_size = relative_font_size
+        self.color = color
+        self.__fonts = dict()
+
+    def _font(self, size_pt: int):
+        """Returns the label font in the given size, loading it only once per size."""
+        from PIL import ImageFont
+
+        font = self.__fonts.get(size_pt)
+        if font is None:
+            font = ImageFont.truetype(FONT_PATH, size=size_pt)
+            self.__fonts[size_pt] = font
+        return font
+
+    def draw(self, image, detections: Union[Iterable[dict], dict]):
+        """Draws boxes and labels onto an image in place.
+
+        Args:
+            image (PIL.Image.Image): The image to draw on.
+            detections (iterable of dicts or dict): Detections with the keys "label" and "bbox", or a result of `ObjectDetector.detect`.
+
+        Returns:
+            PIL.Image.Image: The annotated image.
+        """
+        from PIL import ImageDraw
+
+        if isinstance(detections, dict):
+            detections = [
+                {"label": label, **detection}
+                for label, detection in detections.items()
+                if label != "annotated_image"
+            ]
+
+        draw = ImageDraw.Draw(image)
+        for detection in detections:
+            box = detection["bbox"]
+            font_size_px = (box[3] - box[1]) * self.relative_font_size
+            font = self._font(max(1, round(px_to_pt(font_size_px))))
+            draw.rectangle(box, outline=self.color, width=2)
+            draw.text(box[:2], detection["label"], fill=self.color, font=font)
+        return image
+
+    @staticmethod
+    def encode(image, format: Optional[str] = None, quality: Optional[int] = None):
+        """Encodes an image as a base64 string.
+
+        Args:
+            image (PIL.Image.Image): The image to encode.
+            format (str, optional): Image format, e.g., "JPEG" or "PNG". Defaults to None, in which case the format of the source file is used.
+            quality (int, optional): Quality setting passed to the encoder. Defaults to None.
+
+        Returns:
+            str: The base64-encoded image.
+        """
+        options = dict() if quality is None else {"quality": quality}
+        byte_buffer = io.BytesIO()
+        image.save(byte_buffer, format=format or image.format or "PNG", **options)
+        return base64.b64encode(byte_buffer.getvalue()).decode()
+
+    def render(
+        self,
+        image,
+        detections: Union[Iterable[dict], dict],
+        format: Optional[str] = None,
+        quality: Optional[int] = None,
+    ) -> str:
+        """Draws the detections onto an image and encodes it once.
+
+        Args:
+            image (PIL.Image.Image, path-like object or file-like object): The image to draw on.
+            detections (iterable of dicts or dict): Detections with the keys "label" and "bbox", or a result of `ObjectDetector.detect`.
+            format (str, optional): Image format. Defaults to the format of the source file.
+            quality (int, optional): Quality setting passed to the encoder. Defaults to None.
+
+        Returns:
+            str: The base64-encoded annotated image.
+        """
+        from PIL import Image
+
+        if not isinstance(image, Image.Image):
+            image = Image.open(image)
+        image_format = image.format
+        image = self.draw(image, detections)
+        return self.encode(image, format=format or image_format, quality=quality)
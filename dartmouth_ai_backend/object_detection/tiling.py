@@ -0,0 +1,73 @@
+def tile_boxes(width: int, height: int, tile_size: int, overlap: int) -> list[tuple]:
+    """Cuts an image into overlapping tiles.
+
+    Args:
+        width (int): Width of the image in pixels.
+        height (int): Height of the image in pixels.
+        tile_size (int): Edge length of the (square) tiles in pixels.
+        overlap (int): Number of pixels adjacent tiles share.
+
+    Returns:
+        list[tuple]: The (left, upper, right, lower) box of each tile. Tiles along the
+        right and lower edges are shifted inwards so that all tiles have the same size,
+        unless the image is smaller than a tile.
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError("The overlap must be smaller than the tile size.")
+
+    def origins(length):
+        stride = tile_size - overlap
+        last = max(length - tile_size, 0)
+        positions = list(range(0, last + 1, stride))
+        if positions[-1] != last:
+            positions.append(last)
+        return positions
+
+    return [
+        (left, upper, min(left + tile_size, width), min(upper + tile_size, height))
+        for upper in origins(height)
+        for left in origins(width)
+    ]
+
+
+def non_max_suppression(detections: list[dict], iou_threshold=0.5) -> list[dict]:
+    """Removes duplicate detections of the same object.
+
+    Whenever two detections with the same label overlap with an intersection over
+    union above `iou_threshold`, only the one with the higher score is kept.
+
+    Args:
+        detections (list[dict]): Detections with the keys "label", "score", and "bbox".
+        iou_threshold (float, optional): Overlap above which detections are considered duplicates. Defaults to 0.5.
+
+    Returns:
+        list[dict]: The remaining detections, by descending score.
+    """
+    import torch
+
+    if not detections:
+        return []
+
+    boxes = torch.tensor([d["bbox"] for d in detections], dtype=torch.float64)
+    scores = torch.tensor([d["score"] for d in detections])
+    labels = {label: i for i, label in enumerate({d["label"] for d in detections})}
+    label_ids = torch.tensor([labels[d["label"]] for d in detections])
+
+    # Move the boxes of each label into a separate region, so that boxes with
+    # different labels never overlap
+    boxes = boxes + (label_ids * (boxes.max() + 1))[:, None]
+
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    top_left = torch.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = torch.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    intersection = (bottom_right - top_left).clamp(min=0).prod(dim=2)
+    iou = intersection / (areas[:, None] + areas[None, :] - intersection)
+
+    keep = []
+    suppressed = torch.zeros(len(detections), dtype=torch.bool)
+    for i in scores.argsort(descending=True).tolist():
+        if suppressed[i]:
+            continue
+        keep.append(i)
+        suppressed |= iou[i] > iou_threshold
+    return [detections[i] for i in keep]
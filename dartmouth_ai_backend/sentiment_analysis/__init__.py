@@ -1,6 +1,18 @@
 """Sentiment Analysis in written text
 """
-from .sentiment_analysis import SentimentAnalyzer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .sentiment_analysis import SentimentAnalyzer
 
 
 __all__ = ["SentimentAnalyzer"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "SentimentAnalyzer":
+        from .sentiment_analysis import SentimentAnalyzer
+
+        return SentimentAnalyzer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
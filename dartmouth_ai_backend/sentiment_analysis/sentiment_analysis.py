@@ -1,26 +1,120 @@
 """ Sentiment Analysis """
-import spacy
-from spacytextblob.spacytextblob import (
-    SpacyTextBlob,
-)  # Ignore warning about unused import!
+from ..base.cache import ResultCache, digest_text
+from ..base.chunking import chunk_text
+from ..base.registry import default_registry, load_spacy
+
+from itertools import islice
+from typing import Iterable, Iterator, Optional
 
 
 class SentimentAnalyzer:
-    def __init__(self, lang="en"):
+    def __init__(self, lang="en", cache: Optional[ResultCache] = None):
         if lang != "en":
             raise NotImplementedError(
                 "Sentiment Analysis is currently " "only supported for English texts."
             )
+        from spacytextblob.spacytextblob import (
+            SpacyTextBlob,
+        )  # Ignore warning about unused import!
+
+        self.__nlp = default_registry.acquire(
+            "en_core_web_trf", load_spacy, disable=["parser"]
+        )
+        # Created with the pipeline on first use, so that it is loaded lazily
+        self.__textblob = None
+        self.__cache = cache
+
+    def analyze(
+        self, text, chunk_tokens: Optional[int] = None, batch_size: int = 8
+    ) -> dict:
+        """Analyzes the sentiment of a text.
+
+        Args:
+            text (string): The text to be analyzed.
+            chunk_tokens (int, optional): Split long texts into paragraph- or sentence-aligned chunks of about this many tokens, which run through the pipeline in batches. The scores of the chunks are averaged, weighted by their number of tokens. Defaults to None, in which case the whole text is processed at once.
+            batch_size (int, optional): Number of chunks per batch. Defaults to 8.
+
+        Returns:
+            dict: The polarity ("polarity") and subjectivity ("subjectivity") of the text.
+        """
+        if self.__cache is not None:
+            params = dict() if chunk_tokens is None else {"chunk_tokens": chunk_tokens}
+            return self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_text(text), "en_core_web_trf/spacytextblob", **params
+                ),
+                lambda: self._analyze(text, chunk_tokens, batch_size),
+            )
+        return self._analyze(text, chunk_tokens, batch_size)
+
+    def analyze_many(
+        self, texts: Iterable[str], batch_size: int = 32
+    ) -> Iterator[dict]:
+        """Analyzes the sentiment of a collection of texts.
+
+        The texts are streamed through the pipeline in batches, so the transformer
+        runs one padded forward pass per batch instead of one per text.
+
+        Args:
+            texts (iterable of strings): The texts to be analyzed.
+            batch_size (int, optional): Number of texts per batch. Defaults to 32.
+
+        Yields:
+            dict: The result for each text, in input order, in the same format as `analyze`.
+        """
+        if self.__cache is None:
+            yield from self._analyze_batch(texts, batch_size)
+            return
+
+        # Look up each batch in the cache and only run the pipeline on the misses
+        texts = iter(texts)
+        while batch := list(islice(texts, batch_size)):
+            keys = [
+                ResultCache.key(digest_text(text), "en_core_web_trf/spacytextblob")
+                for text in batch
+            ]
+            yield from self.__cache.map_batch(
+                keys,
+                lambda misses: self._analyze_batch(
+                    [batch[i] for i in misses], batch_size
+                ),
+            )
+
+    def _analyze(self, text, chunk_tokens: Optional[int] = None, batch_size: int = 1):
+        if chunk_tokens is None:
+            return next(self._analyze_batch([text], batch_size=1))
+        spans = chunk_text(text, chunk_tokens) or [(0, len(text))]
+        results = self._analyze_batch(
+            (text[start:end] for start, end in spans),
+            batch_size=batch_size,
+            with_length=True,
+        )
 
-        self.__nlp = spacy.load("en_core_web_trf", disable=["parser"])
-        self.__nlp.add_pipe("spacytextblob")
+        # Longer chunks weigh more, as they would in a single pass over the text
+        total = polarity = subjectivity = 0.0
+        for result, length in results:
+            total += length
+            polarity += result["polarity"] * length
+            subjectivity += result["subjectivity"] * length
+        if total == 0:
+            return {"polarity": 0.0, "subjectivity": 0.0}
+        return {"polarity": polarity / total, "subjectivity": subjectivity / total}
 
-    def analyze(self, text):
-        analyzed = self.__nlp(text)
-        return {
-            "polarity": analyzed._.blob.polarity,
-            "subjectivity": analyzed._.blob.subjectivity,
-        }
+    def _analyze_batch(
+        self, texts: Iterable[str], batch_size: int, with_length: bool = False
+    ) -> Iterator:
+        nlp = self.__nlp.get()
+        if self.__textblob is None:
+            # The pipeline is shared with other analyzers, so run the TextBlob
+            # component separately instead of adding it to the pipeline
+            self.__textblob = nlp.create_pipe("spacytextblob")
+        for doc in nlp.pipe(texts, batch_size=batch_size):
+            analyzed = self.__textblob(doc)
+            result = {
+                "polarity": analyzed._.blob.polarity,
+                "subjectivity": analyzed._.blob.subjectivity,
+            }
+            yield (result, len(doc)) if with_length else result
 
     @staticmethod
     def how_to_cite(format="bibtex") -> str:
@@ -0,0 +1,23 @@
+"""Serving the analyzers over HTTP with dynamic micro-batching
+"""
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .batching import MicroBatcher
+    from .server import AnalysisServer, Endpoint
+
+
+__all__ = ["AnalysisServer", "Endpoint", "MicroBatcher"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "MicroBatcher":
+        from .batching import MicroBatcher
+
+        return MicroBatcher
+    if name in ("AnalysisServer", "Endpoint"):
+        from . import server
+
+        return getattr(server, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
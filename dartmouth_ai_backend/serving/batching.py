@@ -0,0 +1,136 @@
+import asyncio
+from collections import deque
+from concurrent.futures import Executor, ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+
+class MicroBatcher:
+    """Collects concurrent requests into batches for a batch function.
+
+    Requests that arrive within `max_delay` seconds of the oldest waiting request
+    are grouped into one batch of up to `max_batch_size` items. The batch function
+    runs in an executor, off the event loop, and each caller receives the result
+    for its own item. At most one batch runs at a time, so requests keep queuing
+    while the model is busy and are served together afterwards.
+    """
+
+    def __init__(
+        self,
+        run_batch: Callable[[list], list],
+        max_batch_size: int = 32,
+        max_delay: float = 0.01,
+        max_queue: int = 256,
+        executor: Optional[Executor] = None,
+    ):
+        """Initializes the batcher
+
+        Args:
+            run_batch (callable): Maps a list of items to a list of results in the same order.
+            max_batch_size (int, optional): Maximum number of items per batch. Defaults to 32.
+            max_delay (float, optional): Maximum time in seconds the oldest request waits for others to join its batch. Defaults to 0.01.
+            max_queue (int, optional): Maximum number of waiting requests. Further requests are rejected with `asyncio.QueueFull`. Defaults to 256.
+            executor (concurrent.futures.Executor, optional): Executor to run the batches in. Defaults to None, in which case a single thread is used.
+        """
+        self.run_batch = run_batch
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.max_queue = max_queue
+        self.__executor = executor
+        self.__owns_executor = executor is None
+        self.__pending = deque()
+        self.__arrived = None
+        self.__worker = None
+
+    def __len__(self) -> int:
+        """Number of waiting requests"""
+        return len(self.__pending)
+
+    async def submit(self, item) -> Any:
+        """Adds an item to the next batch and waits for its result.
+
+        Raises:
+            asyncio.QueueFull: If `max_queue` requests are already waiting.
+        """
+        if len(self.__pending) >= self.max_queue:
+            raise asyncio.QueueFull()
+
+        loop = asyncio.get_running_loop()
+        if self.__worker is None:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=1, thread_name_prefix="micro_batcher"
+                )
+            self.__arrived = asyncio.Event()
+            self.__worker = loop.create_task(self._work())
+
+        future = loop.create_future()
+        self.__pending.append((item, future, loop.time()))
+        self.__arrived.set()
+        return await future
+
+    async def _work(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            while not self.__pending:
+                self.__arrived.clear()
+                await self.__arrived.wait()
+
+            # Wait for more requests, but never longer than the oldest one may wait
+            deadline = self.__pending[0][2] + self.max_delay
+            while len(self.__pending) < self.max_batch_size:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                self.__arrived.clear()
+                try:
+                    await asyncio.wait_for(self.__arrived.wait(), remaining)
+                except asyncio.TimeoutError:
+                    break
+
+            batch = []
+            while self.__pending and len(batch) < self.max_batch_size:
+                item, future, _ = self.__pending.popleft()
+                # Skip requests whose callers have gone away
+                if not future.done():
+                    batch.append((item, future))
+            if not batch:
+                continue
+
+            items = [item for item, _ in batch]
+            try:
+                results = await loop.run_in_executor(
+                    self.__executor, self.run_batch, items
+                )
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"The batch function returned {len(results)} results "
+                        f"for {len(items)} items."
+                    )
+            except asyncio.CancelledError:
+                for _, future in batch:
+                    future.cancel()
+                raise
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    async def close(self):
+        """Stops batching. Waiting requests are cancelled."""
+        if self.__worker is not None:
+            self.__worker.cancel()
+            try:
+                await self.__worker
+            except asyncio.CancelledError:
+                pass
+            self.__worker = None
+        while self.__pending:
+            _, future, _ = self.__pending.popleft()
+            future.cancel()
+        if self.__owns_executor and self.__executor is not None:
+            self.__executor.shutdown(wait=False)
+            self.__executor = None
@@ -0,0 +1,325 @@
+""" Local HTTP/JSON endpoint for the analyzers """
+from ..base.cache import ResultCache
+from .batching import MicroBatcher
+
+import asyncio
+import base64
+import io
+import json
+import logging
+from concurrent.futures import Executor, ThreadPoolExecutor
+from dataclasses import dataclass
+from http import HTTPStatus
+from typing import Any, Callable, Optional
+
+
+@dataclass
+class Endpoint:
+    """A route of the server.
+
+    Attributes:
+        parse (callable): Turns the JSON payload of a request into an item for `run`. Raises `KeyError`, `TypeError`, or `ValueError` for invalid payloads.
+        run (callable): Maps a list of items to a list of JSON-serializable results in the same order.
+        executor (concurrent.futures.Executor, optional): Executor to run the batches in. Endpoints whose models must not run concurrently, such as two analyzers sharing a spaCy pipeline, share one single-threaded executor. Defaults to None, in which case the endpoint gets a thread of its own.
+    """
+
+    parse: Callable[[Any], Any]
+    run: Callable[[list], list]
+    executor: Optional[Executor] = None
+
+
+def _parse_text(payload) -> str:
+    text = payload["text"]
+    if not isinstance(text, str):
+        raise TypeError("text must be a string")
+    return text
+
+
+def _parse_image(payload) -> tuple:
+    return (
+        base64.b64decode(payload["image"], validate=True),
+        float(payload.get("threshold", 0.7)),
+        bool(payload.get("render", False)),
+    )
+
+
+def default_endpoints(cache: Optional[ResultCache] = None) -> dict[str, Endpoint]:
+    """Creates the endpoints for language detection, named entity recognition, sentiment analysis, and object detection.
+
+    Text endpoints expect a payload of the form `{"text": ...}`. The object detection
+    endpoint expects `{"image": <base64>, "threshold": 0.7, "render": false}`.
+
+    Args:
+        cache (ResultCache, optional): Cache shared by the analyzers. Defaults to None.
+
+    Returns:
+        dict[str, Endpoint]: The endpoints by path.
+    """
+    from ..language_detection import LanguageDetector
+    from ..named_entity_recognition import NamedEntityRecognizer
+    from ..object_detection import ObjectDetector
+    from ..sentiment_analysis import SentimentAnalyzer
+
+    language_detector = LanguageDetector(cache=cache, fast=True)
+    recognizer = NamedEntityRecognizer(cache=cache)
+    sentiment_analyzer = SentimentAnalyzer(cache=cache)
+    object_detector = ObjectDetector(cache=cache)
+    # Both analyzers use the same spaCy pipeline, which is not thread-safe
+    spacy_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="spacy")
+
+    def detect_objects(items: list) -> list:
+        # Requests with different options cannot share a forward pass
+        results = [None] * len(items)
+        groups = dict()
+        for i, (_, threshold, render) in enumerate(items):
+            groups.setdefault((threshold, render), []).append(i)
+        for (threshold, render), indices in groups.items():
+            detected = object_detector.detect_many(
+                [io.BytesIO(items[i][0]) for i in indices],
+                batch_size=len(indices),
+                threshold=threshold,
+                render=render,
+            )
+            for i, result in zip(indices, detected):
+                results[i] = result
+        return results
+
+    return {
+        "/language_detection": Endpoint(
+            _parse_text,
+            lambda texts: list(
+                language_detector.detect_many(texts, batch_size=len(texts))
+            ),
+        ),
+        "/named_entity_recognition": Endpoint(
+            _parse_text,
+            lambda texts: list(recognizer.recognize_many(texts, batch_size=len(texts))),
+            spacy_executor,
+        ),
+        "/sentiment_analysis": Endpoint(
+            _parse_text,
+            lambda texts: list(
+                sentiment_analyzer.analyze_many(texts, batch_size=len(texts))
+            ),
+            spacy_executor,
+        ),
+        "/object_detection": Endpoint(_parse_image, detect_objects),
+    }
+
+
+class AnalysisServer:
+    """Serves the analyzers over HTTP with dynamic micro-batching.
+
+    Each endpoint accepts POST requests with a JSON payload and has its own
+    `MicroBatcher`, so concurrent requests to the same endpoint share a forward
+    pass, while endpoints with different executors run in parallel. When too many
+    requests are waiting for an endpoint, further requests are rejected with status
+    503 until the queue drains. Malformed requests are answered with status 400.
+    `GET /health` reports the number of waiting requests.
+    """
+
+    def __init__(
+        self,
+        endpoints: Optional[dict[str, Endpoint]] = None,
+        host: str = "127.0.0.1",
+        port: int = 8000,
+        max_batch_size: int = 32,
+        max_delay: float = 0.01,
+        max_queue: int = 256,
+        max_body_size: int = 2**26,
+    ):
+        """Initializes the server
+
+        Args:
+            endpoints (dict[str, Endpoint], optional): Endpoints by path. Defaults to None, in which case `default_endpoints` are created.
+            host (str, optional): Address to listen on. Defaults to "127.0.0.1".
+            port (int, optional): Port to listen on. Use 0 to pick a free port. Defaults to 8000.
+            max_batch_size (int, optional): Maximum number of requests per batch. Defaults to 32.
+            max_delay (float, optional): Maximum time in seconds a request waits for others to join its batch. Defaults to 0.01.
+            max_queue (int, optional): Maximum number of waiting requests per endpoint. Defaults to 256.
+            max_body_size (int, optional): Maximum size of a request body in bytes. Defaults to 64 MiB.
+        """
+        self.__owns_endpoints = endpoints is None
+        if endpoints is None:
+            endpoints = default_endpoints()
+        self.endpoints = endpoints
+        self.host = host
+        self.port = port
+        self.max_body_size = max_body_size
+        self.__batchers = {
+            path: MicroBatcher(
+                endpoint.run,
+                max_batch_size=max_batch_size,
+                max_delay=max_delay,
+                max_queue=max_queue,
+                executor=endpoint.executor,
+            )
+            for path, endpoint in endpoints.items()
+        }
+        self.__server = None
+
+    async def start(self):
+        """Starts listening. Updates `port` if a free port was picked."""
+        self.__server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port
+        )
+        self.port = self.__server.sockets[0].getsockname()[1]
+        logging.info(f"Serving on http://{self.host}:{self.port}")
+
+    async def serve_forever(self):
+        if self.__server is None:
+            await self.start()
+        async with self.__server:
+            await self.__server.serve_forever()
+
+    async def close(self):
+        if self.__server is not None:
+            self.__server.close()
+            await self.__server.wait_closed()
+            self.__server = None
+        for batcher in self.__batchers.values():
+            await batcher.close()
+        if self.__owns_endpoints:
+            executors = {e.executor for e in self.endpoints.values()} - {None}
+            for executor in executors:
+                executor.shutdown(wait=False)
+
+    async def _handle_connection(self, reader, writer):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                try:
+                    method, path, version = request_line.decode("latin-1").split()
+                except ValueError:
+                    await self._respond(
+                        writer, HTTPStatus.BAD_REQUEST, {"error": "Bad request"}
+                    )
+                    break
+
+                headers = dict()
+                malformed = False
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, colon, value = line.decode("latin-1").partition(":")
+                    if not colon or not name.strip():
+                        malformed = True
+                    headers[name.strip().lower()] = value.strip()
+
+                length = headers.get("content-length", "0") or "0"
+                if malformed or not length.isdecimal():
+                    await self._respond(
+                        writer, HTTPStatus.BAD_REQUEST, {"error": "Bad request"}
+                    )
+                    break
+                length = int(length)
+                if length > self.max_body_size:
+                    await self._respond(
+                        writer,
+                        HTTPStatus.REQUEST_ENTITY_TOO_LARGE,
+                        {"error": "Request body too large"},
+                    )
+                    break
+                body = await reader.readexactly(length) if length else b""
+
+                status, result = await self._dispatch(method, path, body)
+                keep_alive = (
+                    version == "HTTP/1.1"
+                    and headers.get("connection", "").lower() != "close"
+                )
+                await self._respond(writer, status, result, keep_alive)
+                if not keep_alive:
+                    break
+        except ValueError:
+            # A line longer than the limit of the stream reader
+            try:
+                await self._respond(
+                    writer, HTTPStatus.BAD_REQUEST, {"error": "Bad request"}
+                )
+            except ConnectionError:
+                pass
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def _dispatch(self, method: str, path: str, body: bytes) -> tuple:
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, {
+                "status": "ok",
+                "queued": {p: len(b) for p, b in self.__batchers.items()},
+            }
+
+        endpoint = self.endpoints.get(path)
+        if endpoint is None:
+            return HTTPStatus.NOT_FOUND, {"error": f"Unknown endpoint {path}"}
+        if method != "POST":
+            return HTTPStatus.METHOD_NOT_ALLOWED, {"error": "Use POST"}
+
+        try:
+            item = endpoint.parse(json.loads(body))
+        except (KeyError, TypeError, ValueError) as e:
+            return HTTPStatus.BAD_REQUEST, {"error": f"Invalid payload: {e!r}"}
+
+        try:
+            return HTTPStatus.OK, await self.__batchers[path].submit(item)
+        except asyncio.QueueFull:
+            return HTTPStatus.SERVICE_UNAVAILABLE, {"error": "Too many requests"}
+        except Exception as e:
+            logging.exception(f"Request to {path} failed")
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": repr(e)}
+
+    @staticmethod
+    async def _respond(writer, status: HTTPStatus, payload, keep_alive=False):
+        body = json.dumps(payload).encode()
+        head = [
+            f"HTTP/1.1 {status.value} {status.phrase}",
+            "Content-Type: application/json",
+            f"Content-Length: {len(body)}",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}",
+        ]
+        if status == HTTPStatus.SERVICE_UNAVAILABLE:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1") + body)
+        await writer.drain()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="serving",
+        description="Analysis server",
+        epilog="Serves the analyzers over HTTP with dynamic micro-batching.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Address to listen on.")
+    parser.add_argument("--port", type=int, default=8000, help="Port to listen on.")
+    parser.add_argument(
+        "--max-batch-size", type=int, default=32, help="Maximum requests per batch."
+    )
+    parser.add_argument(
+        "--max-delay",
+        type=float,
+        default=0.01,
+        help="Maximum time in seconds a request waits for a batch to fill.",
+    )
+    parser.add_argument(
+        "--max-queue",
+        type=int,
+        default=256,
+        help="Maximum waiting requests per endpoint.",
+    )
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    server = AnalysisServer(
+        host=args.host,
+        port=args.port,
+        max_batch_size=args.max_batch_size,
+        max_delay=args.max_delay,
+        max_queue=args.max_queue,
+    )
+    asyncio.run(server.serve_forever())
@@ -1,6 +1,23 @@
 """Speaker Diarization in audio recordings
 """
-from .speaker_diarization import SpeakerDiarizer
+from typing import TYPE_CHECKING
 
+if TYPE_CHECKING:
+    from .speaker_diarization import SpeakerDiarizer
+    from .turns import SpeakerTurns
 
-__all__ = ["SpeakerDiarizer"]
+
+__all__ = ["SpeakerDiarizer", "SpeakerTurns"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "SpeakerDiarizer":
+        from .speaker_diarization import SpeakerDiarizer
+
+        return SpeakerDiarizer
+    if name == "SpeakerTurns":
+        from .turns import SpeakerTurns
+
+        return SpeakerTurns
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
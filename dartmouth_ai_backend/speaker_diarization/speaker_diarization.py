@@ -1,10 +1,16 @@
-import numpy as np
-import pandas as pd
-from pyannote.audio import Pipeline
-import torchaudio
+from ..base.audio import Audio
+from ..base.cache import ResultCache, digest_file
+from ..base.registry import default_registry
+from ..base.runtime import RuntimeConfig, check_dtype, resolve_runtime
+from .turns import SpeakerTurns
 
 import logging
 import os
+from typing import TYPE_CHECKING, BinaryIO, Optional, Union
+from os import PathLike
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class SpeakerDiarizer:
@@ -12,58 +18,107 @@ class SpeakerDiarizer:
         self,
         pipeline="pyannote/speaker-diarization-3.1",
         use_auth_token=None,
-        device="cpu",
+        device: Optional[str] = None,
         model_cache=None,
+        cache: Optional[ResultCache] = None,
+        runtime: Optional[RuntimeConfig] = None,
     ):
-        """Initializes the Speaker Diarizer and loads the pipeline
+        """Initializes the Speaker Diarizer
+
+        The pipeline is loaded on first use through the shared model registry.
 
         Args:
             pipeline (str, optional): Name of the pipeline to load. Defaults to "pyannote/speaker-diarization-3.1".
-            device (str, optional): Device to use for inference. Can be "cpu", "mps", or "cuda". Defaults to "cpu".
+            device (str, optional): Device to use for inference. Can be "cpu", "mps", or "cuda". Must not differ from the device of `runtime`. Defaults to None, in which case "cpu" is used.
             model_cache (_type_, optional): Path to download the model file or load it from. Defaults to `.cache/hf/hub`.
-        """
+            cache (ResultCache, optional): Cache to store results in and look them up from. Defaults to None.
+            runtime (RuntimeConfig, optional): Device and thread settings for inference. The pipeline always runs in float32. Defaults to None, in which case `device` is used.
 
+        Raises:
+            ValueError: If `runtime` sets a type other than float32.
+        """
         if use_auth_token is None:
             use_auth_token = os.getenv("HUGGINGFACE_AUTH_TOKEN")
 
         if model_cache is None:
             model_cache = ".cache/hf/hub"
-        logging.info("Loading diarization pipeline")
-        self.__pipeline = Pipeline.from_pretrained(
+        self.__runtime = resolve_runtime(runtime, device)
+        check_dtype(self.__runtime, ("float32",), "The diarization pipeline")
+        self.__runtime.apply()
+        # Keep the token out of the registry key
+        self.__pipeline = default_registry.acquire(
             "pyannote/speaker-diarization-3.1",
-            use_auth_token=use_auth_token,
-            cache_dir=model_cache,
+            lambda name, **config: _load_pipeline(
+                name, use_auth_token=use_auth_token, **config
+            ),
+            model_cache=model_cache,
+            device=self.__runtime.device,
         )
+        self.__cache = cache
+
+    def load(self):
+        """Loads the pipeline now instead of on the first call to `diarize`."""
+        self.__pipeline.get()
 
     def diarize(
         self,
-        speech_file,
+        speech_file: Union[Audio, BinaryIO, str, PathLike],
         transcript=None,
         num_speakers=None,
         min_speakers=None,
         max_speakers=None,
-    ) -> pd.DataFrame:
-        logging.info("Loading audio")
-        waveform, sample_rate = torchaudio.load(speech_file)
-        logging.info("Running diarization pipeline")
-        diarization = self.__pipeline(
-            {"waveform": waveform, "sample_rate": sample_rate},
-            num_speakers=num_speakers,
-            min_speakers=min_speakers,
-            max_speakers=max_speakers,
-        )
-        diarization = pd.DataFrame(
-            diarization.itertracks(yield_label=True),
-            columns=["segment", "label", "speaker"],
-        )
-        diarization["start"] = diarization["segment"].apply(lambda x: x.start)
-        diarization["end"] = diarization["segment"].apply(lambda x: x.end)
+    ) -> Union[SpeakerTurns, dict]:
+        """Determines who spoke when in a speech file.
+
+        Args:
+            speech_file (Audio, path-like object or file-like object): Speech file to process. Pass an `Audio` to reuse audio that has already been decoded.
+            transcript (dict, optional): A transcript produced by `SpeechRecognizer` to assign speakers to. Defaults to None.
+            num_speakers (int, optional): Number of speakers in the speech file. Defaults to None.
+            min_speakers (int, optional): Minimum number of speakers in the speech file. Defaults to None.
+            max_speakers (int, optional): Maximum number of speakers in the speech file. Defaults to None.
+
+        Returns:
+            SpeakerTurns | dict: The speaker turns, or the transcript with assigned speaker IDs if a transcript was passed.
+        """
+        if self.__cache is not None:
+            diarization = self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_file(speech_file),
+                    "pyannote/speaker-diarization-3.1",
+                    num_speakers=num_speakers,
+                    min_speakers=min_speakers,
+                    max_speakers=max_speakers,
+                ),
+                lambda: self._diarize(
+                    speech_file, num_speakers, min_speakers, max_speakers
+                ),
+            )
+        else:
+            diarization = self._diarize(
+                speech_file, num_speakers, min_speakers, max_speakers
+            )
 
         if transcript is not None:
             transcript = self._assign_word_speakers(diarization, transcript)
             return transcript
         return diarization
 
+    def _diarize(
+        self, speech_file, num_speakers, min_speakers, max_speakers
+    ) -> SpeakerTurns:
+        logging.info("Loading audio")
+        audio = Audio.load(speech_file)
+        logging.info("Running diarization pipeline")
+        pipeline = self.__pipeline.get()
+        with self.__runtime.inference():
+            diarization = pipeline(
+                audio.to_pyannote(),
+                num_speakers=num_speakers,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+            )
+        return SpeakerTurns.from_annotation(diarization)
+
     @staticmethod
     def how_to_cite(format="bibtex") -> str:
         if format != "bibtex":
@@ -77,60 +132,134 @@ class SpeakerDiarizer:
 
     @staticmethod
     def _assign_word_speakers(
-        diarize_df: pd.DataFrame, transcript_result: dict[str, str | list]
-    ) -> list:
+        diarization: Union[SpeakerTurns, "pd.DataFrame"],
+        transcript_result: dict[str, str | list],
+    ) -> dict:
         """Assigns a speaker ID to each segment in a transcript
 
         This function is largely identical with whisperx' implementation (https://github.com/m-bain/whisperX/blob/main/whisperx/diarize.py).
 
         Args:
-            diarize_df (pd.DataFrame): A pandas dataframe containing diarization information
+            diarization (SpeakerTurns | pd.DataFrame): The speaker turns, or a pandas dataframe with the columns "start", "end", and "speaker"
             transcript_result (dict[str, str  |  list]): A transcript in the format produced by `SpeechRecognizer`
 
         Returns:
-            list: A list of segments with assigned speaker IDs
+            dict: A copy of the transcript whose segments and words carry the assigned speaker IDs. The input is left unchanged.
         """
-        transcript_segments = transcript_result["segments"]
-        for seg in transcript_segments:
-            # assign speaker to segment (if any)
-            diarize_df["intersection"] = np.minimum(
-                diarize_df["end"], seg["end"]
-            ) - np.maximum(diarize_df["start"], seg["start"])
-            diarize_df["union"] = np.maximum(
-                diarize_df["end"], seg["end"]
-            ) - np.minimum(diarize_df["start"], seg["start"])
-            # remove no hit
-            dia_tmp = diarize_df[diarize_df["intersection"] > 0]
-            if len(dia_tmp) > 0:
-                # sum over speakers
-                speaker = (
-                    dia_tmp.groupby("speaker")["intersection"]
-                    .sum()
-                    .sort_values(ascending=False)
-                    .index[0]
-                )
-                seg["speaker"] = speaker
-
-            # assign speaker to words
+        import numpy as np
+
+        # Copy the segments and words, so that the caller's transcript stays intact
+        segments = []
+        for seg in transcript_result["segments"]:
+            seg = dict(seg)
             if "words" in seg:
-                for word in seg["words"]:
-                    if "start" in word:
-                        diarize_df["intersection"] = np.minimum(
-                            diarize_df["end"], word["end"]
-                        ) - np.maximum(diarize_df["start"], word["start"])
-                        diarize_df["union"] = np.maximum(
-                            diarize_df["end"], word["end"]
-                        ) - np.minimum(diarize_df["start"], word["start"])
-                        # remove no hit
-                        dia_tmp = diarize_df[diarize_df["intersection"] > 0]
-                        if len(dia_tmp) > 0:
-                            # sum over speakers
-                            speaker = (
-                                dia_tmp.groupby("speaker")["intersection"]
-                                .sum()
-                                .sort_values(ascending=False)
-                                .index[0]
-                            )
-                            word["speaker"] = speaker
+                seg["words"] = [dict(word) for word in seg["words"]]
+            segments.append(seg)
+        transcript_result = {**transcript_result, "segments": segments}
+
+        # Collect every segment and every timed word, so that all of them can be
+        # matched against the speaker turns in one pass
+        targets = []
+        for seg in segments:
+            targets.append(seg)
+            if "words" in seg:
+                targets.extend(word for word in seg["words"] if "start" in word)
+
+        if not isinstance(diarization, SpeakerTurns):
+            diarization = SpeakerTurns.from_pandas(diarization)
+        dominant = _dominant_speakers(
+            diarization.start,
+            diarization.end,
+            diarization.codes,
+            len(diarization.speakers),
+            np.array([target["start"] for target in targets], dtype=np.float64),
+            np.array([target["end"] for target in targets], dtype=np.float64),
+        )
+
+        speakers = diarization.speakers
+        for target, code in zip(targets, dominant.tolist()):
+            if code >= 0:
+                target["speaker"] = speakers[code]
 
         return transcript_result
+
+
+def _load_pipeline(name: str, use_auth_token=None, model_cache=None, device="cpu"):
+    """Loads a pyannote pipeline. Suitable as a `loader` for `ModelRegistry.acquire`."""
+    import torch
+    from pyannote.audio import Pipeline
+
+    logging.info("Loading diarization pipeline")
+    pipeline = Pipeline.from_pretrained(
+        name, use_auth_token=use_auth_token, cache_dir=model_cache
+    )
+    pipeline.to(torch.device(device))
+    return pipeline
+
+
+def _dominant_speakers(
+    turn_starts, turn_ends, turn_speakers, n_speakers: int, starts, ends
+):
+    """Finds the speaker with the largest total overlap for each query interval.
+
+    Candidate turns are found with a sweep over the turns sorted by start time, so
+    only turns that can actually overlap a query are ever compared with it.
+
+    Args:
+        turn_starts (np.ndarray): Start times of the speaker turns
+        turn_ends (np.ndarray): End times of the speaker turns
+        turn_speakers (np.ndarray): Speaker code of each turn, in `range(n_speakers)`
+        n_speakers (int): Number of distinct speakers
+        starts (np.ndarray): Start times of the query intervals
+        ends (np.ndarray): End times of the query intervals
+
+    Returns:
+        np.ndarray: The code of the dominant speaker for each query interval, or -1
+        if no turn overlaps it. Ties go to the lowest speaker code.
+    """
+    import numpy as np
+
+    n_queries = len(starts)
+    dominant = np.full(n_queries, -1, dtype=np.int64)
+    if n_queries == 0 or len(turn_starts) == 0:
+        return dominant
+
+    order = np.argsort(turn_starts, kind="stable")
+    # Turns at sorted positions < hi start before the query ends
+    hi = np.searchsorted(turn_starts[order], ends, side="left")
+    # Turns at sorted positions < lo end before the query starts, because
+    # even the latest end among them does not reach past the query start
+    reach = np.maximum.accumulate(turn_ends[order])
+    lo = np.searchsorted(reach, starts, side="right")
+
+    counts = np.clip(hi - lo, 0, None)
+    queries = np.repeat(np.arange(n_queries), counts)
+    positions = (
+        np.arange(counts.sum())
+        - np.repeat(np.cumsum(counts) - counts, counts)
+        + np.repeat(lo, counts)
+    )
+    turns = order[positions]
+
+    intersection = np.minimum(turn_ends[turns], ends[queries]) - np.maximum(
+        turn_starts[turns], starts[queries]
+    )
+    hit = intersection > 0
+    queries, turns, intersection = queries[hit], turns[hit], intersection[hit]
+
+    # Sum over speakers in the original turn order
+    by_turn = np.lexsort((turns, queries))
+    queries, turns, intersection = (
+        queries[by_turn],
+        turns[by_turn],
+        intersection[by_turn],
+    )
+    totals = np.bincount(
+        queries * n_speakers + turn_speakers[turns],
+        weights=intersection,
+        minlength=n_queries * n_speakers,
+    ).reshape(n_queries, n_speakers)
+
+    has_hit = np.bincount(queries, minlength=n_queries) > 0
+    dominant[has_hit] = totals[has_hit].argmax(axis=1)
+    return dominant
@@ -0,0 +1,153 @@
+import json
+from typing import TYPE_CHECKING, Iterable, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+class SpeakerTurns:
+    """Speaker turns in a compact columnar layout.
+
+    Start and end times are stored as float64 arrays and speakers as integer codes
+    into the sorted list of speaker labels, so a recording with many turns takes a
+    few bytes per turn instead of a Python object per value.
+
+    Attributes:
+        start (np.ndarray): Start time of each turn in seconds.
+        end (np.ndarray): End time of each turn in seconds.
+        codes (np.ndarray): Index of the speaker of each turn into `speakers`.
+        speakers (list[str]): The distinct speaker labels, sorted.
+    """
+
+    def __init__(
+        self,
+        start: Sequence[float],
+        end: Sequence[float],
+        codes: Sequence[int],
+        speakers: Iterable[str],
+    ):
+        self.start = np.asarray(start, dtype=np.float64)
+        self.end = np.asarray(end, dtype=np.float64)
+        self.speakers = list(speakers)
+        self.codes = np.asarray(codes, dtype=_code_dtype(len(self.speakers)))
+        if not len(self.start) == len(self.end) == len(self.codes):
+            raise ValueError("All columns must have the same length.")
+
+    @classmethod
+    def from_labels(
+        cls, start: Sequence[float], end: Sequence[float], labels: Sequence[str]
+    ) -> "SpeakerTurns":
+        """Creates the turns from one speaker label per turn."""
+        speakers, codes = np.unique(np.asarray(labels, dtype=str), return_inverse=True)
+        return cls(start, end, codes, speakers.tolist())
+
+    @classmethod
+    def from_annotation(cls, annotation) -> "SpeakerTurns":
+        """Creates the turns from the output of a pyannote pipeline.
+
+        Args:
+            annotation (pyannote.core.Annotation): The diarization.
+
+        Returns:
+            SpeakerTurns: One turn per track, in the order of `itertracks`.
+        """
+        start, end, labels = [], [], []
+        for segment, _, label in annotation.itertracks(yield_label=True):
+            start.append(segment.start)
+            end.append(segment.end)
+            labels.append(label)
+        return cls.from_labels(start, end, labels)
+
+    @classmethod
+    def from_pandas(cls, df: "pd.DataFrame") -> "SpeakerTurns":
+        """Creates the turns from a DataFrame with the columns "start", "end", and "speaker"."""
+        return cls.from_labels(
+            df["start"].to_numpy(dtype=np.float64),
+            df["end"].to_numpy(dtype=np.float64),
+            df["speaker"].astype(str).to_numpy(),
+        )
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SpeakerTurns":
+        """Creates the turns from the output of `to_dict`."""
+        return cls(data["start"], data["end"], data["codes"], data["speakers"])
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, SpeakerTurns):
+            return NotImplemented
+        return (
+            self.speakers == other.speakers
+            and np.array_equal(self.start, other.start)
+            and np.array_equal(self.end, other.end)
+            and np.array_equal(self.codes, other.codes)
+        )
+
+    def __repr__(self) -> str:
+        return f"SpeakerTurns({len(self)} turns, {len(self.speakers)} speakers)"
+
+    @property
+    def speaker(self) -> np.ndarray:
+        """The speaker label of each turn"""
+        return np.asarray(self.speakers, dtype=str)[self.codes]
+
+    def to_pandas(self) -> "pd.DataFrame":
+        """Returns the turns as a DataFrame with a categorical "speaker" column."""
+        import pandas as pd
+
+        return pd.DataFrame(
+            {
+                "start": self.start,
+                "end": self.end,
+                "speaker": pd.Categorical.from_codes(
+                    self.codes, categories=self.speakers
+                ),
+            }
+        )
+
+    def to_dict(self) -> dict:
+        """Returns the columns as lists, suitable for JSON."""
+        return {
+            "start": self.start.tolist(),
+            "end": self.end.tolist(),
+            "codes": self.codes.tolist(),
+            "speakers": list(self.speakers),
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict())
+
+    def to_arrow(self):
+        """Returns the turns as a `pyarrow.Table` with a dictionary-encoded "speaker" column.
+
+        Requires pyarrow, which is not installed by default.
+        """
+        import pyarrow as pa
+
+        return pa.table(
+            {
+                "start": pa.array(self.start, type=pa.float64()),
+                "end": pa.array(self.end, type=pa.float64()),
+                "speaker": pa.DictionaryArray.from_arrays(
+                    pa.array(self.codes), pa.array(self.speakers, type=pa.string())
+                ),
+            }
+        )
+
+    def to_parquet(self, path):
+        """Writes the turns to a Parquet file. Requires pyarrow."""
+        import pyarrow.parquet as pq
+
+        pq.write_table(self.to_arrow(), path)
+
+
+def _code_dtype(n_speakers: int):
+    """Returns the smallest signed integer type that can hold the speaker codes."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_speakers <= np.iinfo(dtype).max:
+            return dtype
+    return np.int64
@@ -1,6 +1,18 @@
 """Speech Recognition of audio recordings
 """
-from .speech_recognition import SpeechRecognizer
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .speech_recognition import SpeechRecognizer
 
 
 __all__ = ["SpeechRecognizer"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "SpeechRecognizer":
+        from .speech_recognition import SpeechRecognizer
+
+        return SpeechRecognizer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
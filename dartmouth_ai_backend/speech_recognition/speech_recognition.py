@@ -1,32 +1,91 @@
-import whisper
-import torch
-import torchaudio
-import librosa
-
+from ..base.audio import SAMPLE_RATE, Audio, stream_mono_16k
+from ..base.cache import ResultCache, digest_file
+from ..base.quantization import check_quantize, load_quantized
+from ..base.registry import default_registry
+from ..base.runtime import RuntimeConfig, check_dtype, limit_threads, resolve_runtime
 from ..speaker_diarization import SpeakerDiarizer
 
-from typing import Union, BinaryIO, Optional
+import dataclasses
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, Iterator, Union, BinaryIO, Optional
 from os import PathLike
 
 
 class SpeechRecognizer:
-    def __init__(self, model="large-v2", device="cpu", model_cache=None, diarize=False):
-        """Initializes the Speech Recognizer and loads the model
+    def __init__(
+        self,
+        model="large-v2",
+        device: Optional[str] = None,
+        model_cache=None,
+        diarize=False,
+        diarizer: Optional[SpeakerDiarizer] = None,
+        concurrent: bool = False,
+        thread_split: Optional[tuple[int, int]] = None,
+        cache: Optional[ResultCache] = None,
+        runtime: Optional[RuntimeConfig] = None,
+        quantize: Optional[str] = None,
+    ):
+        """Initializes the Speech Recognizer
+
+        The model is loaded on first use through the shared model registry.
 
         Args:
             model (str, optional): Name of the model to load. Defaults to "large-v2".
-            device (str, optional): Device to use for inference. Can be "cpu", "mps", or "cuda". Defaults to "cpu".
+            device (str, optional): Device to use for inference. Can be "cpu", "mps", or "cuda". Must not differ from the device of `runtime`. Defaults to None, in which case "cpu" is used.
             model_cache (str, optional): Path to download the model file or load it from. Defaults to `~/.cache/whisper`.
+            diarize (bool, optional): Load the diarization pipeline right away instead of on the first diarized transcription. Defaults to False.
+            diarizer (SpeakerDiarizer, optional): Diarizer to use for diarized transcriptions. Defaults to None, in which case one is created when needed.
+            concurrent (bool, optional): Run transcription and diarization in parallel on the same audio. Defaults to False.
+            thread_split (tuple[int, int], optional): Number of torch threads for transcription and diarization, respectively, when running concurrently. Takes precedence over the `num_threads` of the runtime. Defaults to None, in which case the runtime's `num_threads`, or else the available threads, are split evenly.
+            cache (ResultCache, optional): Cache to store results in and look them up from. Defaults to None.
+            runtime (RuntimeConfig, optional): Device, type, and thread settings for inference. Whisper runs in float16 or float32. The device and thread settings are shared with the diarizer, which runs in float32. Defaults to None, in which case `device` is used.
+            quantize (str, optional): Set to "int8" to quantize the linear layers dynamically for faster CPU inference. The quantized model is cached in `model_cache`, or in `~/.cache/dartmouth_ai_backend` if that is not set. Defaults to None.
+
+        Raises:
+            ValueError: If `runtime` sets a type other than float16 or float32.
         """
-        self.__model = whisper.load_model(
-            model, download_root=model_cache, device=torch.device(device)
+        import torch
+
+        self.__runtime = resolve_runtime(runtime, device)
+        check_dtype(self.__runtime, ("float16", "float32"), "Whisper")
+        check_quantize(quantize, self.__runtime)
+        self.__runtime.apply()
+        self.__model = default_registry.acquire(
+            f"whisper/{model}",
+            _load_whisper,
+            model_cache=model_cache,
+            quantize=quantize,
+            device=self.__runtime.device,
         )
+        self.model_name = model if quantize is None else f"{model}/{quantize}"
         self.model_cache = model_cache
-        self.device = device
+        self.device = self.__runtime.device
+        self.__diarizer = diarizer
+        if diarize:
+            self._get_diarizer().load()
+
+        self.concurrent = concurrent
+        if thread_split is None:
+            threads = self.__runtime.num_threads or torch.get_num_threads()
+            thread_split = (max(1, threads - threads // 2), max(1, threads // 2))
+        self.thread_split = thread_split
+        self.__executor = None
+        self.__cache = cache
+
+    def _get_diarizer(self) -> SpeakerDiarizer:
+        """Returns the diarizer, loading the pipeline on first use."""
+        if self.__diarizer is None:
+            # The type only applies to Whisper
+            self.__diarizer = SpeakerDiarizer(
+                model_cache=self.model_cache,
+                runtime=dataclasses.replace(self.__runtime, dtype=None),
+            )
+        return self.__diarizer
 
     def transcribe(
         self,
-        speech_file: Union[BinaryIO, str, PathLike],
+        speech_file: Union[Audio, BinaryIO, str, PathLike],
         task: str = "transcribe",
         language: Optional[str] = None,
         diarize: bool = False,
@@ -37,7 +96,7 @@ class SpeechRecognizer:
         """Transcribes a speech file to text with optional labeling of the speaker ID.
 
         Args:
-            speech_file (path-like object or file-like object): Speech file to process.
+            speech_file (Audio, path-like object or file-like object): Speech file to process. Pass an `Audio` to reuse audio that has already been decoded.
             task (str, optional): Task to perform ("transcribe" or "translate"). Defaults to "transcribe".
             language (str, optional): Language of the speech file. Defaults to None.
             diarize (bool, optional): Run speaker diarization. Defaults to False.
@@ -48,18 +107,67 @@ class SpeechRecognizer:
         Returns:
             dict[str, str | list]: A dictionary containing the resulting text ("text") and segment-level details ("segments"), and the spoken language ("language"), which is detected when "language" is None.
         """
-        # Librosa does not support loading MP3 from a BytesIO object, so go through torchaudio instead
-        waveform, sample_rate = torchaudio.load(speech_file)
-        # Mono conversion and resampling is more convenient in librosa
-        waveform = librosa.to_mono(waveform.numpy())
-        waveform = librosa.resample(waveform, orig_sr=sample_rate, target_sr=16_000)
-        transcription = self.__model.transcribe(waveform, task=task, language=language)
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_file(speech_file),
+                    f"whisper/{self.model_name}",
+                    task=task,
+                    language=language,
+                    diarize=diarize,
+                    num_speakers=num_speakers,
+                    min_speakers=min_speakers,
+                    max_speakers=max_speakers,
+                ),
+                lambda: self._transcribe(
+                    speech_file,
+                    task,
+                    language,
+                    diarize,
+                    num_speakers,
+                    min_speakers,
+                    max_speakers,
+                ),
+            )
+        return self._transcribe(
+            speech_file,
+            task,
+            language,
+            diarize,
+            num_speakers,
+            min_speakers,
+            max_speakers,
+        )
+
+    def _transcribe(
+        self,
+        speech_file,
+        task,
+        language,
+        diarize,
+        num_speakers,
+        min_speakers,
+        max_speakers,
+    ) -> dict[str, str | list]:
+        # Decode once and share the audio with the diarizer
+        audio = Audio.load(speech_file)
+        audio.mono_16k  # Resample before the audio is shared between threads
+
+        if diarize and self.concurrent:
+            return self._transcribe_concurrently(
+                audio,
+                task=task,
+                language=language,
+                num_speakers=num_speakers,
+                min_speakers=min_speakers,
+                max_speakers=max_speakers,
+            )
+
+        transcription = self._run_model(audio.mono_16k, task=task, language=language)
 
         if diarize:
-            transcription = SpeakerDiarizer(
-                model_cache=self.model_cache, device=self.device
-            ).diarize(
-                speech_file=speech_file,
+            transcription = self._get_diarizer().diarize(
+                speech_file=audio,
                 transcript=transcription,
                 num_speakers=num_speakers,
                 min_speakers=min_speakers,
@@ -68,6 +176,303 @@ class SpeechRecognizer:
 
         return transcription
 
+    def transcribe_stream(
+        self,
+        speech_file: Union[BinaryIO, str, PathLike],
+        task: str = "transcribe",
+        language: Optional[str] = None,
+        window: float = 30.0,
+        overlap: float = 5.0,
+    ) -> Iterator[dict]:
+        """Transcribes a speech file window by window, yielding segments as they finish.
+
+        The recording is decoded and resampled in chunks, so memory use does not grow
+        with its duration. Segments that end within `overlap` seconds of the end of a
+        window may have been cut off and are transcribed again as part of the next window.
+        The first segments are yielded as soon as the first window is transcribed, so
+        short windows keep the latency low.
+
+        Decoding relies on `torchaudio.io.StreamReader`, which is deprecated in recent
+        versions of torchaudio. The version pinned in requirements.txt provides it.
+
+        Args:
+            speech_file (path-like object or file-like object): Speech file to process.
+            task (str, optional): Task to perform ("transcribe" or "translate"). Defaults to "transcribe".
+            language (str, optional): Language of the speech file. Defaults to None, in which case it is detected from the first window.
+            window (float, optional): Duration of audio to transcribe at a time in seconds. Defaults to 30.0, the context of the model.
+            overlap (float, optional): Duration at the end of each window in seconds whose segments are deferred to the next window. Defaults to 5.0.
+
+        Yields:
+            dict: Segments in the format of the "segments" returned by `transcribe`, with timestamps relative to the start of the recording.
+        """
+        import torch
+        from whisper.audio import FRAMES_PER_SECOND
+
+        if not 0 <= overlap < window:
+            raise ValueError("The overlap must be shorter than the window.")
+
+        chunks = stream_mono_16k(speech_file)
+        buffer = torch.zeros(0, dtype=torch.float32)
+        offset = 0.0
+        prompt = None
+        segment_id = 0
+        exhausted = False
+        while True:
+            pending = [buffer]
+            pending_samples = len(buffer)
+            while pending_samples < window * SAMPLE_RATE and not exhausted:
+                chunk = next(chunks, None)
+                if chunk is None:
+                    exhausted = True
+                else:
+                    pending.append(chunk)
+                    pending_samples += len(chunk)
+            buffer = torch.cat(pending)
+            if len(buffer) == 0:
+                return
+
+            result = self._run_model(
+                buffer, task=task, language=language, initial_prompt=prompt
+            )
+            # Keep the language consistent across windows
+            language = result["language"]
+            segments = result["segments"]
+
+            if exhausted:
+                finished, consumed = segments, len(buffer) / SAMPLE_RATE
+            else:
+                cutoff = len(buffer) / SAMPLE_RATE - overlap
+                finished = [s for s in segments if s["end"] <= cutoff] or segments[:1]
+                consumed = finished[-1]["end"] if finished else cutoff
+                if consumed <= 0:
+                    consumed = cutoff
+
+            for segment in finished:
+                segment["id"] = segment_id
+                segment["seek"] += round(offset * FRAMES_PER_SECOND)
+                segment["start"] += offset
+                segment["end"] += offset
+                for word in segment.get("words", []):
+                    word["start"] += offset
+                    word["end"] += offset
+                segment_id += 1
+                yield segment
+
+            if exhausted:
+                return
+            if finished:
+                # Condition the next window on the end of the text so far
+                prompt = "".join(s["text"] for s in finished)[-200:]
+            consumed_samples = round(consumed * SAMPLE_RATE)
+            buffer = buffer[consumed_samples:]
+            offset += consumed_samples / SAMPLE_RATE
+
+    def transcribe_many(
+        self,
+        speech_files: Iterable[Union[Audio, BinaryIO, str, PathLike]],
+        task: str = "transcribe",
+        language: Optional[str] = None,
+        batch_size: int = 16,
+    ) -> Iterator[dict[str, str | list]]:
+        """Transcribes a collection of speech files, decoding windows of several files together.
+
+        The next 30-second window of up to `batch_size` recordings is encoded and
+        decoded in one shared batch. As in `transcribe`, each recording then moves on
+        to the end of the last complete segment of its window, so segments are not cut
+        at window boundaries. This is much faster than calling `transcribe` repeatedly
+        for collections of short clips. Unlike `transcribe`, each window is decoded
+        greedily and independently of the text of the previous window.
+
+        Args:
+            speech_files (iterable of Audio, path-like objects or file-like objects): Speech files to process.
+            task (str, optional): Task to perform ("transcribe" or "translate"). Defaults to "transcribe".
+            language (str, optional): Language of all speech files. Defaults to None, in which case it is detected for each file from its first window.
+            batch_size (int, optional): Number of windows per batch, and number of files read ahead. Defaults to 16.
+
+        Yields:
+            dict[str, str | list]: The result for each file, in input order, in the same format as `transcribe`.
+        """
+        speech_files = iter(speech_files)
+        while batch := list(islice(speech_files, batch_size)):
+            if self.__cache is None:
+                yield from self._transcribe_batch(batch, task, language, batch_size)
+                continue
+
+            # Only run the model on the cache misses
+            keys = [
+                ResultCache.key(
+                    digest_file(speech_file),
+                    f"whisper/{self.model_name}",
+                    task=task,
+                    language=language,
+                    batched=True,
+                )
+                for speech_file in batch
+            ]
+            yield from self.__cache.map_batch(
+                keys,
+                lambda misses: self._transcribe_batch(
+                    [batch[i] for i in misses], task, language, batch_size
+                ),
+            )
+
+    def _transcribe_batch(
+        self, speech_files: list, task, language, batch_size
+    ) -> list[dict[str, str | list]]:
+        import torch
+        import whisper
+        from whisper.audio import FRAMES_PER_SECOND, HOP_LENGTH, N_FRAMES, N_SAMPLES
+
+        model = self.__model.get()
+        device = self.__runtime.device
+        if self.__runtime.dtype is not None:
+            fp16 = self.__runtime.dtype == "float16"
+        else:
+            fp16 = device != "cpu"
+
+        # Log-Mel frames of each recording, padded like in `whisper.transcribe`.
+        # Windows are cut from them as the decoding proceeds.
+        mels = []
+        for speech_file in speech_files:
+            audio = Audio.load(speech_file).mono_16k
+            mels.append(
+                whisper.log_mel_spectrogram(audio, padding=N_SAMPLES, device=device)
+            )
+        content_frames = [mel.shape[-1] - N_FRAMES for mel in mels]
+        seeks = [0] * len(speech_files)
+
+        def window(file_index: int):
+            seek = seeks[file_index]
+            mel = mels[file_index][:, seek : seek + N_FRAMES]
+            return whisper.pad_or_trim(mel, N_FRAMES)
+
+        # Detect the language of each recording from its first window
+        languages = [language] * len(speech_files)
+        if not model.is_multilingual:
+            languages = ["en"] * len(speech_files)
+        elif language is None:
+            for start in range(0, len(speech_files), batch_size):
+                indices = range(start, min(start + batch_size, len(speech_files)))
+                mel = torch.stack([window(i) for i in indices])
+                if fp16:
+                    mel = mel.half()
+                with self.__runtime.inference():
+                    _, probs = model.detect_language(mel)
+                for i, file_probs in zip(indices, probs):
+                    languages[i] = max(file_probs, key=file_probs.get)
+
+        tokenizer_options = dict()
+        if hasattr(model, "num_languages"):
+            tokenizer_options["num_languages"] = model.num_languages
+        tokenizer = whisper.tokenizer.get_tokenizer(
+            model.is_multilingual, **tokenizer_options
+        )
+
+        # Decode the next window of up to `batch_size` recordings at a time, and
+        # move each recording on to the end of its last complete segment. Windows
+        # in one batch share the decoding options, so they have the same language.
+        segments = [[] for _ in speech_files]
+        while active := [i for i, seek in enumerate(seeks) if seek < content_frames[i]]:
+            batch_language = languages[active[0]]
+            batch = [i for i in active if languages[i] == batch_language][:batch_size]
+            options = whisper.DecodingOptions(
+                task=task, language=batch_language, temperature=0.0, fp16=fp16
+            )
+            mel = torch.stack([window(i) for i in batch])
+            with self.__runtime.inference():
+                decoded = whisper.decode(model, mel, options)
+
+            for file_index, result in zip(batch, decoded):
+                seek = seeks[file_index]
+                segment_size = min(N_FRAMES, content_frames[file_index] - seek)
+                # Skip silence, using the thresholds of `whisper.transcribe`
+                if result.no_speech_prob > 0.6 and result.avg_logprob <= -1.0:
+                    seeks[file_index] += segment_size
+                    continue
+
+                window_segments, consumed = _window_segments(
+                    result.tokens,
+                    tokenizer,
+                    segment_size * HOP_LENGTH / SAMPLE_RATE,
+                )
+                offset = seek * HOP_LENGTH / SAMPLE_RATE
+                for start_time, end_time, tokens in window_segments:
+                    segments[file_index].append(
+                        {
+                            "seek": seek,
+                            "start": offset + start_time,
+                            "end": offset + end_time,
+                            "text": tokenizer.decode(
+                                [t for t in tokens if t < tokenizer.eot]
+                            ),
+                            "tokens": tokens,
+                            "temperature": result.temperature,
+                            "avg_logprob": result.avg_logprob,
+                            "compression_ratio": result.compression_ratio,
+                            "no_speech_prob": result.no_speech_prob,
+                        }
+                    )
+                advance = round(consumed * FRAMES_PER_SECOND)
+                # Always make progress, even if no segment was completed
+                seeks[file_index] += advance if advance > 0 else segment_size
+
+            # Release the frames of recordings that are done
+            for i in batch:
+                if seeks[i] >= content_frames[i]:
+                    mels[i] = None
+
+        results = []
+        for file_segments, file_language in zip(segments, languages):
+            for i, segment in enumerate(file_segments):
+                segment["id"] = i
+            results.append(
+                {
+                    "text": "".join(s["text"] for s in file_segments),
+                    "segments": file_segments,
+                    "language": file_language,
+                }
+            )
+        return results
+
+    def _run_model(self, audio, **options) -> dict[str, str | list]:
+        """Runs Whisper on 16 kHz mono audio with the runtime settings applied."""
+        if self.__runtime.dtype is not None:
+            options["fp16"] = self.__runtime.dtype == "float16"
+        with self.__runtime.inference():
+            return self.__model.get().transcribe(audio, **options)
+
+    def _transcribe_concurrently(
+        self, audio: Audio, task, language, num_speakers, min_speakers, max_speakers
+    ) -> dict[str, str | list]:
+        """Runs transcription and diarization in parallel and merges the results."""
+        diarizer = self._get_diarizer()
+        if self.__executor is None:
+            self.__executor = ThreadPoolExecutor(
+                max_workers=2, thread_name_prefix="speech_recognition"
+            )
+
+        asr_threads, diarization_threads = self.thread_split
+        transcription = self.__executor.submit(
+            _with_torch_threads,
+            asr_threads,
+            self._run_model,
+            audio.mono_16k,
+            task=task,
+            language=language,
+        )
+        diarization = self.__executor.submit(
+            _with_torch_threads,
+            diarization_threads,
+            diarizer.diarize,
+            audio,
+            num_speakers=num_speakers,
+            min_speakers=min_speakers,
+            max_speakers=max_speakers,
+        )
+        return SpeakerDiarizer._assign_word_speakers(
+            diarization.result(), transcription.result()
+        )
+
     @staticmethod
     def how_to_cite(format="bibtex") -> str:
         if format != "bibtex":
@@ -81,3 +486,88 @@ class SpeechRecognizer:
     year = {2022},
     copyright = {arXiv.org perpetual, non-exclusive license}
 }"""
+
+
+def _load_whisper(name: str, model_cache=None, quantize=None, device="cpu"):
+    """Loads a Whisper model. Suitable as a `loader` for `ModelRegistry.acquire`."""
+    import torch
+    import whisper
+
+    model = name.removeprefix("whisper/")
+    if quantize is None:
+        return whisper.load_model(
+            model, download_root=model_cache, device=torch.device(device)
+        ).eval()
+    return load_quantized(
+        f"whisper-{model}",
+        lambda: whisper.load_model(model, download_root=model_cache, device="cpu"),
+        cache_dir=model_cache,
+        packages=["openai-whisper"],
+    )
+
+
+def _window_segments(
+    tokens: list[int], tokenizer, duration: float
+) -> tuple[list[tuple], float]:
+    """Splits the tokens decoded from one window at their timestamp tokens.
+
+    Follows the segmentation of `whisper.transcribe`: a pair of consecutive timestamp
+    tokens ends one segment and starts the next. Text after the last pair belongs to
+    a segment that continues beyond the window, so it is left to the next window.
+
+    Returns:
+        tuple[list[tuple], float]: The start and end time in seconds relative to the window, and the tokens of each segment, and the time in seconds at which the next window should start.
+    """
+    from whisper.audio import HOP_LENGTH
+
+    # Timestamp tokens count steps of two Mel frames
+    time_precision = 2 * HOP_LENGTH / SAMPLE_RATE
+    is_timestamp = [t >= tokenizer.timestamp_begin for t in tokens]
+    consecutive = [
+        i + 1 for i in range(len(tokens) - 1) if is_timestamp[i] and is_timestamp[i + 1]
+    ]
+
+    if not consecutive:
+        # At most a single timestamp, so the whole window is one segment
+        timestamps = [t for t, ts in zip(tokens, is_timestamp) if ts]
+        end = duration
+        if timestamps and timestamps[-1] != tokenizer.timestamp_begin:
+            end = (timestamps[-1] - tokenizer.timestamp_begin) * time_precision
+        return ([(0.0, end, tokens)] if tokens else []), duration
+
+    single_timestamp_ending = is_timestamp[-2:] == [False, True]
+    if single_timestamp_ending:
+        # The last segment ends with a single timestamp
+        consecutive.append(len(tokens))
+    segments = []
+    last_slice = 0
+    for current_slice in consecutive:
+        sliced = tokens[last_slice:current_slice]
+        segments.append(
+            (
+                (sliced[0] - tokenizer.timestamp_begin) * time_precision,
+                (sliced[-1] - tokenizer.timestamp_begin) * time_precision,
+                sliced,
+            )
+        )
+        last_slice = current_slice
+
+    if single_timestamp_ending:
+        # Nothing is left unfinished, so go on after the window
+        return segments, duration
+    # Go on at the last timestamp, where the unfinished segment starts
+    return (
+        segments,
+        (tokens[last_slice - 1] - tokenizer.timestamp_begin) * time_precision,
+    )
+
+
+def _with_torch_threads(num_threads: int, fn: Callable, *args, **kwargs):
+    """Calls a function with the torch intra-op thread count of the calling thread set.
+
+    With the OpenMP backend the thread count is a per-thread setting, so two workers
+    can each use their own share of the cores. The count also applies to forward
+    passes whose runtime sets `num_threads`.
+    """
+    with limit_threads(num_threads):
+        return fn(*args, **kwargs)
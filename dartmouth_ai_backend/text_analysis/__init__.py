@@ -0,0 +1,18 @@
+"""Combined analysis of written text
+"""
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from .text_analysis import TextAnalyzer
+
+
+__all__ = ["TextAnalyzer"]
+
+
+def __getattr__(name):
+    # Defer importing the implementation until the class is first used
+    if name == "TextAnalyzer":
+        from .text_analysis import TextAnalyzer
+
+        return TextAnalyzer
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
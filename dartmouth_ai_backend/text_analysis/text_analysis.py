@@ -0,0 +1,115 @@
+""" Combined Text Analysis """
+from ..base.cache import ResultCache, digest_text
+from ..base.registry import default_registry, load_spacy
+from ..language_detection import LanguageDetector
+from ..named_entity_recognition import NamedEntityRecognizer
+
+from typing import Optional
+
+
+class TextAnalyzer:
+    """Detects the language, named entities, and sentiment of a text in a single pass."""
+
+    def __init__(self, cache: Optional[ResultCache] = None):
+        """Initializes the Text Analyzer
+
+        Args:
+            cache (ResultCache, optional): Cache to store results in and look them up from. Defaults to None.
+        """
+        import spacy_fastlang  # Ignore warning about unused import!
+        from spacytextblob.spacytextblob import (
+            SpacyTextBlob,
+        )  # Ignore warning about unused import!
+
+        self.__nlp = default_registry.acquire(
+            "en_core_web_trf", load_spacy, disable=["parser"]
+        )
+        # Created with the pipeline on first use, so that it is loaded lazily
+        self.__language_detector = None
+        self.__textblob = None
+        self.__cache = cache
+
+    def analyze(self, text: str, render: bool = False) -> dict:
+        """Analyzes a text.
+
+        The text is tokenized once and the resulting `Doc` is shared by all stages.
+        Named entities and sentiment are only computed for English texts.
+
+        Args:
+            text (string): The text to be analyzed.
+            render (bool, optional): Also render the entities as HTML. Defaults to False.
+
+        Returns:
+            dict: A dictionary containing the keys language and score, as returned by
+            `LanguageDetector.detect`, entities, as returned by
+            `NamedEntityRecognizer.recognize`, and sentiment, as returned by
+            `SentimentAnalyzer.analyze`. The latter two are None for non-English texts.
+        """
+        if self.__cache is not None:
+            return self.__cache.get_or_compute(
+                ResultCache.key(
+                    digest_text(text),
+                    "en_core_web_trf/spacy_fastlang/spacytextblob",
+                    render=render,
+                ),
+                lambda: self._analyze(text, render),
+            )
+        return self._analyze(text, render)
+
+    def _analyze(self, text: str, render: bool = False) -> dict:
+        nlp = self.__nlp.get()
+        if self.__textblob is None:
+            self.__language_detector = nlp.create_pipe("language_detector")
+            self.__textblob = nlp.create_pipe("spacytextblob")
+        doc = self.__language_detector(nlp.make_doc(text))
+        result = {
+            "language": doc._.language,
+            "score": doc._.language_score,
+            "entities": None,
+            "sentiment": None,
+        }
+        if doc._.language != "en":
+            return result
+
+        for _, proc in nlp.pipeline:
+            doc = proc(doc)
+        doc = self.__textblob(doc)
+
+        result["entities"] = NamedEntityRecognizer._format(doc, render)
+        result["sentiment"] = {
+            "polarity": doc._.blob.polarity,
+            "subjectivity": doc._.blob.subjectivity,
+        }
+        return result
+
+    @staticmethod
+    def how_to_cite(format="bibtex") -> str:
+        if format != "bibtex":
+            return NotImplemented
+        return "\n\n".join(
+            [LanguageDetector.how_to_cite(), NamedEntityRecognizer.how_to_cite()]
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        prog="text_analysis",
+        description="Text Analysis",
+        epilog="Detects the language, named entities, and sentiment in a given text.",
+    )
+
+    parser.add_argument(
+        "textfile",
+        metavar="txt",
+        type=str,
+        help="The name of the text file to process.",
+    )
+
+    args = parser.parse_args()
+
+    with open(args.textfile) as f:
+        raw_text = f.read()
+
+    print(TextAnalyzer().analyze(raw_text))
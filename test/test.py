@@ -1,13 +1,21 @@
-from dartmouth_ai_backend.object_detection import ObjectDetector
+from dartmouth_ai_backend.object_detection import AnnotationRenderer, ObjectDetector
 from dartmouth_ai_backend.language_detection import LanguageDetector
 from dartmouth_ai_backend.named_entity_recognition import NamedEntityRecognizer
 from dartmouth_ai_backend.sentiment_analysis import SentimentAnalyzer
-from dartmouth_ai_backend.speaker_diarization import SpeakerDiarizer
+from dartmouth_ai_backend.speaker_diarization import SpeakerDiarizer, SpeakerTurns
 from dartmouth_ai_backend.speech_recognition import SpeechRecognizer
+from dartmouth_ai_backend.text_analysis import TextAnalyzer
+
+from dartmouth_ai_backend.base import ResultCache, RuntimeConfig, default_registry
+from dartmouth_ai_backend.base.audio import Audio
 
 from dotenv import load_dotenv
 
 from pathlib import Path
+import copy
+import json
+import subprocess
+import sys
 
 
 load_dotenv(Path(__file__).parent.parent / "secrets.env")
@@ -21,10 +29,88 @@ def test_citations():
         SentimentAnalyzer,
         SpeechRecognizer,
         SpeakerDiarizer,
+        TextAnalyzer,
     ]:
         assert obj.how_to_cite()
 
 
+def test_lazy_imports():
+    for subpackage in [
+        "language_detection",
+        "named_entity_recognition",
+        "object_detection",
+        "sentiment_analysis",
+        "serving",
+        "speaker_diarization",
+        "speech_recognition",
+        "text_analysis",
+    ]:
+        heavy = subprocess.run(
+            [
+                sys.executable,
+                "-c",
+                f"import sys, dartmouth_ai_backend.{subpackage}; "
+                "print([m for m in ('torch', 'transformers', 'whisper', 'spacy', "
+                "'pandas', 'pyannote.audio') if m in sys.modules])",
+            ],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+        assert heavy == "[]", f"{subpackage} imports {heavy}"
+
+
+def test_result_cache(tmp_path):
+    cache = ResultCache(tmp_path / "results.sqlite", max_size=1000)
+    key = ResultCache.key("digest", "model", threshold=0.7)
+    assert key != ResultCache.key("digest", "model", threshold=0.8)
+    assert cache.get(key) is None
+    cache.set(key, {"a": 1})
+    assert cache.get(key) == {"a": 1}
+    assert cache.get_or_compute(key, lambda: None) == {"a": 1}
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 1
+
+    # Filling the cache evicts the least recently used entries
+    for i in range(100):
+        cache.set(ResultCache.key(str(i), "model"), "x" * 100)
+    assert cache.size <= 1000
+    assert cache.get(key) is None
+
+    with open(Path(__file__).parent.resolve() / "en.txt") as f:
+        en_text = f.read()
+    detector = LanguageDetector(cache=cache)
+    assert detector.detect(en_text) == detector.detect(en_text)
+    assert cache.stats()["hits"] == 3
+
+
+def test_result_cache_batches(tmp_path):
+    cache = ResultCache(tmp_path / "results.sqlite", max_size=1000)
+    keys = [ResultCache.key(str(i), "model") for i in range(4)]
+    cache.set_many([(keys[0], 0), (keys[2], 2)])
+    computed = []
+
+    def compute_misses(misses):
+        computed.append(misses)
+        return [i * 10 for i in misses]
+
+    assert cache.map_batch(keys, compute_misses) == [0, 10, 2, 30]
+    assert cache.map_batch(keys, compute_misses) == [0, 10, 2, 30]
+    # Only the misses of the first batch were computed
+    assert computed == [[1, 3]]
+
+    # Replacing a result does not count its old size twice
+    size = cache.size
+    cache.set(keys[0], 0)
+    assert cache.size == size
+    for i in range(100):
+        cache.set(ResultCache.key(str(i), "other"), "x" * 100)
+    assert cache.size <= 1000
+    assert cache.size == cache.stats()["size"]
+    reopened = ResultCache(tmp_path / "results.sqlite", max_size=1000)
+    assert reopened.size == cache.size
+
+
 def test_language_detection():
     with open(Path(__file__).parent.resolve() / "de.txt") as f:
         de_text = f.read()
@@ -38,6 +124,17 @@ def test_language_detection():
     r = LanguageDetector().detect(en_text)
     assert r["language"], "en"
 
+    detector = LanguageDetector()
+    fast = LanguageDetector(fast=True)
+    texts = [de_text, en_text, "Bonjour tout le monde"]
+    expected = [detector.detect(text) for text in texts]
+    assert list(detector.detect_many(texts, batch_size=2)) == expected
+    assert list(fast.detect_many(texts)) == expected
+    assert [fast.detect(text) for text in texts] == expected
+    r = fast.detect(en_text, top_k=3)
+    assert r["language"] == r["languages"][0]["language"]
+    assert len(r["languages"]) == 3
+
 
 def test_named_entity_recognition():
     with open(Path(__file__).parent.resolve() / "wiki.txt") as f:
@@ -47,13 +144,385 @@ def test_named_entity_recognition():
     result = ner.recognize(raw_text)
     assert result
 
+    results = list(ner.recognize_many([raw_text, raw_text[:500]], batch_size=2))
+    assert len(results) == 2
+    assert results[0] == result
+
+    assert "html" not in result
+    assert result["entities"]
+    for entity in result["entities"]:
+        assert raw_text[entity["start_char"] : entity["end_char"]] == entity["text"]
+        assert entity["label"] in result["tag_key"]
+    rendered = ner.recognize(raw_text, render=True)
+    assert rendered["entities"] == result["entities"]
+    assert rendered["html"]
+    assert result["entities"][0]["text"] in ner.render(raw_text, result["entities"])
+
+
+def test_chunking():
+    import spacy
+
+    from dartmouth_ai_backend.base.chunking import chunk_text, count_tokens
+    from dartmouth_ai_backend.named_entity_recognition.ner import merge_chunks
+
+    text = "Dartmouth College is in Hanover. It was founded in 1769.\n\n" * 20
+    spans = chunk_text(text, max_tokens=25)
+    assert len(spans) > 1
+    assert "".join(text[start:end] for start, end in spans) == text
+    assert all(count_tokens(text[start:end]) <= 25 for start, end in spans)
+
+    nlp = spacy.blank("en")
+    nlp.add_pipe("entity_ruler").add_patterns(
+        [{"label": "ORG", "pattern": "Dartmouth College"}]
+    )
+    merged = merge_chunks(nlp.pipe(text[start:end] for start, end in spans))
+    assert merged.text == text
+    assert len(merged.ents) == 20
+    assert all(
+        text[ent.start_char : ent.end_char] == "Dartmouth College"
+        for ent in merged.ents
+    )
+
+    # Leading blank lines, as in OCR output, stay part of the first chunk
+    text = "\n\nDartmouth College is in Hanover."
+    spans = chunk_text(text, max_tokens=2)
+    assert spans[0][0] == 0 and spans[-1][1] == len(text)
+    assert all(a[1] == b[0] for a, b in zip(spans, spans[1:]))
+    merged = merge_chunks(nlp.pipe(text[start:end] for start, end in spans))
+    assert merged.text == text
+    assert [(e.start_char, e.end_char) for e in merged.ents] == [(2, 19)]
+
+    with open(Path(__file__).parent.resolve() / "wiki.txt") as f:
+        raw_text = f.read()
+    assert NamedEntityRecognizer().recognize(raw_text, chunk_tokens=200)
+    sentiment = SentimentAnalyzer().analyze(raw_text, chunk_tokens=200)
+    assert -1 <= sentiment["polarity"] <= 1
+
+
+def test_model_registry():
+    ner = NamedEntityRecognizer()
+    sa = SentimentAnalyzer()
+    assert ner.recognize("Dartmouth College is in Hanover.")
+    assert default_registry.is_loaded("en_core_web_trf", disable=["parser"])
+    assert sa.analyze("Dartmouth College is in Hanover.")
+
+
+def test_handle_finalizer():
+    from dartmouth_ai_backend.base import ModelRegistry
+
+    models = ModelRegistry()
+    loads = []
+
+    def loader(name):
+        loads.append(name)
+        return object()
+
+    first = models.acquire("model", loader)
+    first.get()
+    second = models.acquire("model", loader)
+    # A handle finalized while the registry's lock is held must not deadlock
+    with models._locked():
+        del first
+    second.get()
+    del second
+    models.acquire("model", loader).get()
+    assert loads == ["model", "model"]
+
+
+def test_memory_budget():
+    import torch
+
+    from dartmouth_ai_backend.base import ModelRegistry
+
+    models = ModelRegistry(memory_budget=2**20)
+    loads = []
+
+    def loader(name, in_features):
+        loads.append((name, models.resident_size))
+        return torch.nn.Linear(in_features, 512, bias=False)
+
+    # 512 KiB and 1 MiB of float32 weights
+    small = models.acquire("small", loader, in_features=256)
+    large = models.acquire("large", loader, in_features=512)
+    assert not models.is_loaded("small", in_features=256)
+    small.get()
+    assert models.resident_size == 2**19
+    # Loading the second model exceeds the budget, so the first one is evicted
+    large.get()
+    assert not models.is_loaded("small", in_features=256)
+    assert models.is_loaded("large", in_features=512)
+    # The large model is evicted before the small one is loaded again
+    small.get()
+    assert loads == [("small", 0), ("large", 2**19), ("small", 0)]
+
+
+def test_text_analysis():
+    with open(Path(__file__).parent.resolve() / "en.txt") as f:
+        en_text = f.read()
+
+    result = TextAnalyzer().analyze(en_text)
+    assert result["language"] == "en"
+    assert result["entities"]
+    assert result["sentiment"]
+
+    with open(Path(__file__).parent.resolve() / "de.txt") as f:
+        de_text = f.read()
+
+    result = TextAnalyzer().analyze(de_text)
+    assert result["language"] == "de"
+    assert result["entities"] is None
+
+
+def test_micro_batching():
+    import asyncio
+
+    from dartmouth_ai_backend.serving import MicroBatcher
+
+    batches = []
+
+    def run_batch(items):
+        batches.append(items)
+        return [item * 2 for item in items]
+
+    async def main():
+        batcher = MicroBatcher(run_batch, max_batch_size=4, max_delay=0.05)
+        results = await asyncio.gather(*(batcher.submit(i) for i in range(6)))
+        await batcher.close()
+
+        full = MicroBatcher(run_batch, max_queue=1)
+        first = asyncio.ensure_future(full.submit(0))
+        await asyncio.sleep(0)
+        try:
+            await full.submit(1)
+        except asyncio.QueueFull:
+            rejected = True
+        else:
+            rejected = False
+        await first
+        await full.close()
+        return results, rejected
+
+    results, rejected = asyncio.run(main())
+    assert results == [0, 2, 4, 6, 8, 10]
+    assert batches[:2] == [[0, 1, 2, 3], [4, 5]]
+    assert rejected
+
+
+def test_analysis_server():
+    import asyncio
+
+    from dartmouth_ai_backend.serving import AnalysisServer, Endpoint
+
+    endpoints = {
+        "/upper": Endpoint(
+            lambda payload: payload["text"], lambda texts: [t.upper() for t in texts]
+        )
+    }
+
+    async def request(port, method, path, body=b"", headers=None):
+        if headers is None:
+            headers = f"Content-Length: {len(body)}\r\n"
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(
+            f"{method} {path} HTTP/1.1\r\n{headers}"
+            "Connection: close\r\n\r\n".encode() + body
+        )
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body)
+
+    async def main():
+        server = AnalysisServer(endpoints, port=0)
+        await server.start()
+        responses = await asyncio.gather(
+            *(
+                request(server.port, "POST", "/upper", json.dumps({"text": t}).encode())
+                for t in ["a", "b", "c"]
+            ),
+            request(server.port, "POST", "/upper", b"{}"),
+            request(server.port, "POST", "/lower", b"{}"),
+            request(server.port, "GET", "/health"),
+            request(server.port, "POST", "/upper", headers="Content-Length: -1\r\n"),
+            request(server.port, "POST", "/upper", headers="Content-Length: x\r\n"),
+            request(server.port, "POST", "/upper", headers="Content-Length 2\r\n"),
+        )
+        await server.close()
+        return responses
+
+    responses = asyncio.run(main())
+    assert responses[:3] == [(200, "A"), (200, "B"), (200, "C")]
+    assert [status for status, _ in responses[3:]] == [400, 404, 200, 400, 400, 400]
+
+
+def test_analyzer_pool():
+    from dartmouth_ai_backend.base import AnalyzerPool
+
+    texts = ["This is an English sentence.", "Das ist ein deutscher Satz."] * 4
+    with AnalyzerPool(LanguageDetector, "detect", processes=2) as pool:
+        results = list(pool.map(texts))
+    assert [r["language"] for r in results] == ["en", "de"] * 4
+
+    image = Path(__file__).parent.resolve() / "object_detection_sample.jpg"
+    with AnalyzerPool(ObjectDetector, "detect_many", processes=2, batch_size=2) as pool:
+        results = list(pool.map([image, image.read_bytes(), image], render=False))
+    assert len(results) == 3
+    assert results[0] == results[1] == results[2]
+
+
+def test_object_detection(tmp_path):
+    import base64
+    import io
+
+    import pytest
+    from PIL import Image
 
-def test_object_detection():
     result = ObjectDetector().detect(
         Path(__file__).parent.resolve() / "object_detection_sample.jpg"
     )
     assert result
 
+    # Images of different sizes, two of which have the same aspect ratio
+    image = Path(__file__).parent.resolve() / "object_detection_sample.jpg"
+    desk = Path(__file__).parent.parent.resolve() / "benchmark/benchmark_files/desk.jpg"
+    Image.open(image).crop((0, 0, 1924, 1200)).save(tmp_path / "landscape.jpg")
+    images = [image, desk, tmp_path / "landscape.jpg", image]
+    detector = ObjectDetector()
+    results = list(detector.detect_many(images, batch_size=3, render=False))
+    assert len(results) == 4
+    for image_path, batched in zip(images, results):
+        alone = detector.detect(image_path, render=False)
+        assert batched.keys() == alone.keys()
+        for label, detection in alone.items():
+            assert batched[label]["score"] == pytest.approx(
+                detection["score"], abs=1e-4
+            )
+            assert batched[label]["bbox"] == pytest.approx(detection["bbox"], abs=0.1)
+
+    boxes = ObjectDetector().detect(image, render=False)
+    assert "annotated_image" not in boxes
+    assert boxes.keys() == result.keys() - {"annotated_image"}
+    assert AnnotationRenderer().render(image, boxes, format="PNG")
+
+    # Annotated images keep the size of the source unless reduced decoding is enabled
+    annotated = Image.open(io.BytesIO(base64.b64decode(result["annotated_image"])))
+    assert annotated.size == Image.open(image).size
+    reduced = ObjectDetector(reduced_decode=True).detect(image, render=False)
+    assert reduced.keys() == boxes.keys()
+
+
+def test_reduced_decoding(tmp_path):
+    from PIL import Image
+
+    from dartmouth_ai_backend.object_detection.preprocessing import open_reduced
+
+    # Bitonal scans and palette images, which `Image.reduce` cannot handle directly
+    Image.new("1", (4000, 3000), 1).save(tmp_path / "scan.tiff")
+    Image.new("P", (4000, 3000)).save(tmp_path / "palette.png")
+    for name in ["scan.tiff", "palette.png"]:
+        image, original_size = open_reduced(tmp_path / name, 800, 1333)
+        assert original_size == (4000, 3000)
+        assert image.size == (1334, 1000)
+
+
+def test_runtime_config():
+    import pytest
+    import torch
+
+    num_threads = torch.get_num_threads()
+    try:
+        runtime = RuntimeConfig(num_threads=2)
+        image = Path(__file__).parent.resolve() / "object_detection_sample.jpg"
+        assert ObjectDetector(runtime=runtime).detect(image)
+        assert torch.get_num_threads() == 2
+
+        result = SpeechRecognizer(
+            model="tiny", model_cache=".cache/", runtime=runtime
+        ).transcribe(
+            str(Path(__file__).parent.resolve() / "speech_recognition_sample.flac")
+        )
+        assert result
+
+        with pytest.raises(ValueError):
+            SpeakerDiarizer(device="cuda", runtime=runtime)
+
+        # Types the models cannot run in are rejected instead of ignored
+        with pytest.raises(ValueError):
+            SpeakerDiarizer(runtime=RuntimeConfig(dtype="float16"))
+        with pytest.raises(ValueError):
+            SpeechRecognizer(model="tiny", runtime=RuntimeConfig(dtype="bfloat16"))
+        assert SpeakerDiarizer(runtime=RuntimeConfig(dtype="float32"))
+    finally:
+        torch.set_num_threads(num_threads)
+
+
+def test_quantization():
+    import pytest
+
+    image = Path(__file__).parent.resolve() / "object_detection_sample.jpg"
+    assert ObjectDetector(quantize="int8").detect(image)
+    # The second detector loads the cached quantized model
+    assert ObjectDetector(quantize="int8").detect(image, render=False)
+
+    result = SpeechRecognizer(
+        model="tiny", model_cache=".cache/", quantize="int8"
+    ).transcribe(
+        str(Path(__file__).parent.resolve() / "speech_recognition_sample.flac")
+    )
+    assert result["text"]
+
+    with pytest.raises(ValueError):
+        ObjectDetector(quantize="int4")
+
+
+def test_tiled_object_detection(tmp_path):
+    from PIL import Image
+    from dartmouth_ai_backend.object_detection.tiling import (
+        non_max_suppression,
+        tile_boxes,
+    )
+
+    tiles = tile_boxes(2500, 900, tile_size=1024, overlap=128)
+    assert tiles[0] == (0, 0, 1024, 900)
+    assert tiles[-1] == (1476, 0, 2500, 900)
+
+    detections = [
+        {"label": "cat", "score": 0.9, "bbox": [0, 0, 10, 10]},
+        {"label": "cat", "score": 0.8, "bbox": [1, 1, 10, 10]},
+        {"label": "dog", "score": 0.7, "bbox": [1, 1, 10, 10]},
+    ]
+    assert non_max_suppression(detections) == [detections[0], detections[2]]
+
+    result = ObjectDetector().detect_tiled(
+        Path(__file__).parent.resolve() / "object_detection_sample.jpg",
+        tile_size=256,
+        overlap=32,
+        workers=2,
+    )
+    assert result
+
+    # Two copies of a square crop of the sample side by side, one per tile
+    sample = Image.open(Path(__file__).parent.resolve() / "object_detection_sample.jpg")
+    top = (sample.height - sample.width) // 2
+    sample = sample.crop((0, top, sample.width, top + sample.width))
+    scan = Image.new("RGB", (2 * sample.width, sample.height))
+    scan.paste(sample, (0, 0))
+    scan.paste(sample, (sample.width, 0))
+    scan.save(tmp_path / "scan.jpg")
+
+    result = ObjectDetector().detect_tiled(
+        tmp_path / "scan.jpg",
+        tile_size=sample.width,
+        overlap=0,
+        full_image=False,
+        render=False,
+    )
+    label = result["objects"][0]["label"]
+    same_label = [d for d in result["objects"] if d["label"] == label]
+    assert any(d["bbox"][0] < sample.width for d in same_label)
+    assert any(d["bbox"][0] >= sample.width for d in same_label)
+    assert result[label]["score"] == same_label[0]["score"]
+
 
 def test_speaker_diarization():
     transcript = SpeechRecognizer(model="tiny", model_cache=".cache/").transcribe(
@@ -66,12 +535,178 @@ def test_speaker_diarization():
     assert result
 
 
+def test_shared_audio():
+    speech_file = Path(__file__).parent.resolve() / "speaker_diarization_sample.wav"
+    audio = Audio.load(str(speech_file))
+    transcript = SpeechRecognizer(model="tiny", model_cache=".cache/").transcribe(audio)
+    result = SpeakerDiarizer().diarize(audio, transcript=transcript)
+    assert result
+
+    with open(speech_file, "rb") as f:
+        result = SpeechRecognizer(model="tiny", model_cache=".cache/").transcribe(
+            f, diarize=True
+        )
+    assert result
+
+
+def test_audio_preprocessing():
+    import torch
+
+    from dartmouth_ai_backend.base.audio_preprocessing import resampler, to_mono_16k
+
+    stereo = torch.rand(2, 44_100) * 2 - 1
+    mono = to_mono_16k(stereo, 44_100)
+    assert mono.shape == (16_000,)
+    assert mono.dtype == torch.float32
+    # The kernel is computed once per source rate
+    assert resampler(44_100) is resampler(44_100)
+
+    already_mono = torch.rand(1, 16_000)
+    assert to_mono_16k(already_mono, 16_000).data_ptr() == already_mono.data_ptr()
+
+
+def test_concurrent_transcription():
+    speech_file = str(
+        Path(__file__).parent.resolve() / "speaker_diarization_sample.wav"
+    )
+    sequential = SpeechRecognizer(model="tiny", model_cache=".cache/").transcribe(
+        speech_file, diarize=True
+    )
+    concurrent = SpeechRecognizer(
+        model="tiny", model_cache=".cache/", concurrent=True, thread_split=(2, 2)
+    ).transcribe(speech_file, diarize=True)
+    assert concurrent["text"] == sequential["text"]
+    assert [s.get("speaker") for s in concurrent["segments"]] == [
+        s.get("speaker") for s in sequential["segments"]
+    ]
+
+    # The split holds inside each stage, even if the runtime sets a thread count
+    import torch
+
+    num_threads = torch.get_num_threads()
+    try:
+        runtime = RuntimeConfig(num_threads=4)
+        diarizer = SpeakerDiarizer(runtime=runtime)
+        recognizer = SpeechRecognizer(
+            model="tiny",
+            model_cache=".cache/",
+            diarizer=diarizer,
+            concurrent=True,
+            thread_split=(3, 1),
+            runtime=runtime,
+        )
+        stage_threads = dict()
+
+        def record(name, fn):
+            def stage(*args, **kwargs):
+                result = fn(*args, **kwargs)
+                stage_threads[name] = torch.get_num_threads()
+                return result
+
+            return stage
+
+        recognizer._run_model = record("transcription", recognizer._run_model)
+        diarizer.diarize = record("diarization", diarizer.diarize)
+        recognizer.transcribe(speech_file, diarize=True)
+        assert stage_threads == {"transcription": 3, "diarization": 1}
+    finally:
+        torch.set_num_threads(num_threads)
+
+
+def test_batched_transcription():
+    speech_files = [
+        str(Path(__file__).parent.resolve() / speech_file)
+        for speech_file in [
+            "speech_recognition_sample.flac",
+            "speech_translation_sample.mp3",
+            "speech_recognition_sample.flac",
+        ]
+    ]
+    recognizer = SpeechRecognizer(model="tiny", model_cache=".cache/")
+    results = list(recognizer.transcribe_many(speech_files, batch_size=2))
+    assert len(results) == 3
+    assert all(r.keys() == {"text", "segments", "language"} for r in results)
+    assert results[0]["text"] == results[2]["text"]
+    assert results[0]["language"] == "en"
+
+
+def test_streaming_transcription():
+    recognizer = SpeechRecognizer(model="tiny", model_cache=".cache/")
+    segments = list(
+        recognizer.transcribe_stream(
+            str(Path(__file__).parent.resolve() / "speaker_diarization_sample.wav"),
+            window=20.0,
+            overlap=3.0,
+        )
+    )
+    assert segments
+    assert [s["id"] for s in segments] == list(range(len(segments)))
+    assert all(a["start"] <= b["start"] for a, b in zip(segments, segments[1:]))
+
+
+def test_assign_word_speakers():
+    import pandas as pd
+
+    diarization = pd.DataFrame(
+        {
+            "start": [0.0, 1.0, 0.0, 4.0],
+            "end": [1.0, 2.5, 0.5, 6.0],
+            "speaker": ["SPEAKER_01", "SPEAKER_00", "SPEAKER_00", "SPEAKER_01"],
+        }
+    )
+    transcript = {
+        "segments": [
+            {
+                "start": 0.0,
+                "end": 2.0,
+                "words": [
+                    {"word": "a", "start": 0.2, "end": 0.9},
+                    {"word": "b", "start": 1.2, "end": 1.8},
+                    {"word": "c"},
+                ],
+            },
+            {"start": 2.6, "end": 3.5},
+            {"start": 3.5, "end": 7.0},
+        ]
+    }
+    expected = copy.deepcopy(transcript)
+    expected["segments"][0]["speaker"] = "SPEAKER_00"
+    expected["segments"][0]["words"][0]["speaker"] = "SPEAKER_01"
+    expected["segments"][0]["words"][1]["speaker"] = "SPEAKER_00"
+    expected["segments"][2]["speaker"] = "SPEAKER_01"
+
+    unannotated = copy.deepcopy(transcript)
+    result = SpeakerDiarizer._assign_word_speakers(diarization, unannotated)
+    assert result == expected
+    assert unannotated == transcript
+
+    turns = SpeakerTurns.from_pandas(diarization)
+    assert turns.speakers == ["SPEAKER_00", "SPEAKER_01"]
+    assert turns.codes.tolist() == [1, 0, 0, 1]
+    assert SpeakerTurns.from_dict(json.loads(turns.to_json())) == turns
+    assert turns.to_pandas()["speaker"].tolist() == diarization["speaker"].tolist()
+    assert (
+        SpeakerDiarizer._assign_word_speakers(turns, copy.deepcopy(transcript))
+        == expected
+    )
+
+
 def test_speech_recognition():
     result = SpeechRecognizer(model="tiny", model_cache=".cache/").transcribe(
         str(Path(__file__).parent.resolve() / "speech_recognition_sample.flac"),
         diarize=True,
     )
 
+    recognizer = SpeechRecognizer(model="tiny", model_cache=".cache/", diarize=True)
+    for speech_file in [
+        "speech_recognition_sample.flac",
+        "speaker_diarization_sample.wav",
+    ]:
+        result = recognizer.transcribe(
+            str(Path(__file__).parent.resolve() / speech_file), diarize=True
+        )
+        assert result["segments"]
+
     result = SpeechRecognizer(model="medium", model_cache=".cache/").transcribe(
         str(Path(__file__).parent.resolve() / "speech_translation_sample.mp3"),
         task="translate",